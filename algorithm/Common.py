@@ -1,142 +1,270 @@
 from typing import Iterable
-from entity.Token import Token, VN, VT, EPSILON, END
+from entity.Token import Token, VN, VT, EPSILON, VT_INDEX, EPSILON_BIT, END_BIT
 from entity.Rule import Rule
 
-def updateSet(dst: set, src, epsilonNotAllowed=False):
-    updated = False
-    if isinstance(src, set):
-
-        if epsilonNotAllowed and EPSILON in src:
-            src.remove(EPSILON)
-
-        if not src.issubset(dst):
-            updated = True
-        dst.update(src)
-
-    else:
-        if epsilonNotAllowed and src == EPSILON:
-            return updated
-
-        updated = src not in dst
-        dst.add(src)
-
-    return updated
-
-
-# 构造First集
+# 将src并入dst, 整数不可变, 返回合并后的掩码以及是否更新
+def updateMask(dst: int, src: int, epsilonNotAllowed=False):
+    if epsilonNotAllowed:
+        src &= ~EPSILON_BIT
+    merged = dst | src
+    return merged, merged != dst
+
+
+# 求有向图的强连通分量(Tarjan算法, 非递归实现)
+# edges[u]中的v表示u依赖v, 返回的分量按依赖顺序排列: 被依赖的分量总是先于依赖它的分量出现
+def stronglyConnectedComponents(nodes: Iterable, edges: dict):
+    index = dict()
+    lowLink = dict()
+    onStack = set()
+    stack = []
+    components = []
+    counter = 0
+
+    for root in nodes:
+        if root in index:
+            continue
+
+        index[root] = lowLink[root] = counter
+        counter += 1
+        stack.append(root)
+        onStack.add(root)
+        work = [(root, iter(edges.get(root, ())))]
+
+        while work:
+            node, children = work[-1]
+            for child in children:
+                if child not in index:
+                    index[child] = lowLink[child] = counter
+                    counter += 1
+                    stack.append(child)
+                    onStack.add(child)
+                    work.append((child, iter(edges.get(child, ()))))
+                    break
+                if child in onStack and index[child] < lowLink[node]:
+                    lowLink[node] = index[child]
+            else:
+                work.pop()
+                if work and lowLink[node] < lowLink[work[-1][0]]:
+                    lowLink[work[-1][0]] = lowLink[node]
+
+                # node为分量的根, 出栈得到整个分量
+                if lowLink[node] == index[node]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        onStack.remove(member)
+                        component.append(member)
+                        if member is node:
+                            break
+                    components.append(component)
+
+    return components
+
+
+# 求解集合方程组 X[n] = base[n] ∪ (∪ X[d], d ∈ deps[n]), 集合均为终结符位掩码
+# 按强连通分量的拓扑序处理, 环中的节点缩为一点, 其结果必定相同
+# 每个节点和每条依赖边只处理一次
+def solveSetEquations(nodes: Iterable, base: dict, deps: dict):
+    result = dict()
+    for component in stronglyConnectedComponents(nodes, deps):
+        members = set(component)
+        acc = 0
+        for node in component:
+            acc |= base[node]
+            for dep in deps[node]:
+                if dep not in members:
+                    acc |= result[dep]
+
+        for node in component:
+            result[node] = acc
+
+    return result
+
+
+# 计算可推出空串的非终结符
+# 每条产生式记录尚未确定可空的符号个数, 某个非终结符可空时只更新引用它的产生式
+# known为rules之外的非终结符的First集(位掩码), 只计算rules中的部分时使用, 其中包含EPSILON_BIT即为可空
+def constructNullableSet(rules: dict[VN, Rule], known: dict[VN, int] = None):
+    nullable = set()
+    pending = dict()
+    occurrences: dict[VN, list] = {vn: [] for vn in rules}
+    worklist = []
+
+    for parentVN in rules:
+        rule = rules[parentVN]
+        assert parentVN == rule.parent
+
+        for child in rule.children:
+            key = (parentVN, child)
+            count = 0
+            for token in child:
+                if isinstance(token, VN) and token not in rules:
+                    if not known[token] & EPSILON_BIT:
+                        count = -1
+                        break
+                elif isinstance(token, VN):
+                    count += 1
+                    occurrences[token].append(key)
+                elif token != EPSILON:
+                    # 含有终结符的产生式不可能推出空串
+                    count = -1
+                    break
+
+            pending[key] = count
+            if count == 0 and parentVN not in nullable:
+                nullable.add(parentVN)
+                worklist.append(parentVN)
+
+    while worklist:
+        vn = worklist.pop()
+        for key in occurrences[vn]:
+            if pending[key] <= 0:
+                continue
+            pending[key] -= 1
+            if pending[key] == 0 and key[0] not in nullable:
+                nullable.add(key[0])
+                worklist.append(key[0])
+
+    return nullable
+
+
+# 构造First集, 结果为终结符位掩码, 可空的非终结符包含EPSILON_BIT
 # 所有终结符的First集为本身
-def constructFirstSet(rules: dict[VN, Rule]):
-    updated = True
-    First = {vn: set() for vn in rules}
-
-    while updated:
-        updated = False
-        for parentVN in rules:
-            rule = rules[parentVN]
-            assert parentVN == rule.parent
-
-            for child in rule.children:
-                for token in child:
-
-                    if isinstance(token, VT):
-                        # E : a B c, 如果a为终结符, 将a加入First(E)中，结束该规则的处理
-                        if token not in First[rule.parent]:
-                            updated = True
+# 将更新过程视为有向图, E : A B c 中E依赖A(以及A可空时依赖B)
+# 按强连通分量的拓扑序求解, 不再反复扫描所有规则
+# known为rules之外的非终结符的First集, 视为常量, 用于只重新计算部分非终结符
+def constructFirstMask(rules: dict[VN, Rule], known: dict[VN, int] = None):
+    nullable = constructNullableSet(rules, known)
+    base = {vn: 0 for vn in rules}
+    deps = {vn: set() for vn in rules}
+
+    for parentVN in rules:
+        for child in rules[parentVN].children:
+            for token in child:
+                if token == EPSILON:
+                    continue
 
-                        # 如果为 E : Epsilon, 将Epsilon加入First(E)中
-                        First[rule.parent].add(token)
+                if isinstance(token, VT):
+                    # E : a B c, 如果a为终结符, 将a加入First(E)中，结束该规则的处理
+                    base[parentVN] |= token.bit
+                    break
 
+                if token not in rules:
+                    # 已知的First集直接并入
+                    base[parentVN] |= known[token] & ~EPSILON_BIT
+                    if not known[token] & EPSILON_BIT:
                         break
+                    continue
 
-                    elif isinstance(token, VN):
+                # E: a B c, 如果a为非终结符, First(E)依赖First(a)
+                # 如果a不能推出空推导，不再向下继续
+                deps[parentVN].add(token)
+                if token not in nullable:
+                    break
 
-                        # E: a B c, 如果a为非终结符, 将First(a)加入First(E)中
-                        if not First[token].issubset(First[rule.parent]):
-                            updated = True
+    First = solveSetEquations(rules, base, deps)
 
-                        First[rule.parent] |= First[token]
+    # 如果E可推出空串, 将Epsilon加入First(E)中
+    for vn in nullable:
+        First[vn] |= EPSILON_BIT
 
-                        # 如果a不能推出空推导，不再向下继续
-                        # 否则可推出空匹配，将下一个token的First集合加入parentVN
+    return First
 
-                        if EPSILON not in First[token]:
-                            break
 
+# 文法修改后增量更新First集
+# changed为产生式有变化(包括新增, 删除)的非终结符, 只有产生式体中(直接或间接)引用了它们的非终结符需要重新计算
+# 返回新的First集, 以及First集有变化的非终结符
+def updateFirstMask(rules: dict[VN, Rule], First: dict[VN, int], changed: Iterable[VN]):
+    users: dict[VN, set] = dict()
+    for parentVN in rules:
+        for child in rules[parentVN].children:
+            for token in child:
+                if isinstance(token, VN):
+                    users.setdefault(token, set()).add(parentVN)
 
-                        # if (EPSILON,) not in rules[token].children:
-                            # break
+    affected = set(vn for vn in changed if vn in rules)
+    worklist = list(affected)
+    while worklist:
+        for user in users.get(worklist.pop(), ()):
+            if user not in affected:
+                affected.add(user)
+                worklist.append(user)
 
-    return First
+    result = {vn: First[vn] for vn in rules if vn not in affected}
+    result.update(constructFirstMask({vn: rules[vn] for vn in affected}, result))
+    firstChanged = set(vn for vn in affected if First.get(vn) != result[vn])
+    return result, firstChanged
 
 
-# 获取某个序列的First集合
-def getFirstOfSeq(First: dict[VN, VT], seq: Iterable[Token], followSet: set[VT] = None):
-    results = set()
+# 构造First集
+def constructFirstSet(rules: dict[VN, Rule]):
+    return {vn: VT_INDEX.toSet(mask) for vn, mask in constructFirstMask(rules).items()}
+
 
-    if len(seq) == 0:
-        results.add(EPSILON)
-        if EPSILON in results and followSet is not None:
-            results.remove(EPSILON)
-            return results | followSet
-        return results
-    
+# 获取某个序列的First集合的位掩码, 序列可空时并入followMask
+# 未给出followMask时, 序列可空则结果包含EPSILON_BIT
+def getFirstMaskOfSeq(First: dict[VN, int], seq: Iterable[Token], followMask: int = None):
+    result = 0
     for token in seq:
+        if token == EPSILON:
+            continue
+
         if isinstance(token, VT):
-            results.add(token)
-            if token is not EPSILON:
-                if EPSILON in results:
-                    results.remove(EPSILON)
-                return results
+            return result | token.bit
 
-        elif isinstance(token, VN):
-            results.update(First[token])
-            if EPSILON not in First[token]:
-                if EPSILON in results:
-                    results.remove(EPSILON)
-                return results
+        mask = First[token]
+        if not mask & EPSILON_BIT:
+            return result | mask
+        result |= mask & ~EPSILON_BIT
 
-    if EPSILON in results and followSet is not None and followSet:
-        results.remove(EPSILON)
-        return results | followSet
+    if followMask is None:
+        return result | EPSILON_BIT
+    return result | followMask
 
-    return results
 
-# 构造Follow集
-def constructFollowSet(rules:dict[VN,Rule], First:dict[VN, VT], beginning:VN):
-    # 首先在开始规则的Follow集放入 $
-    # 遍历所有规则, 更新Follow集合,直到Follow集合不再更新
-    updated = True
-    Follow:dict[VN,set] = dict()
+# 构造Follow集, 参数与结果均为终结符位掩码
+# A : a B b, Follow(B)包含First(b), 若b可空, Follow(B)依赖Follow(A)
+# 每条产生式从右向左扫描一次得到所有后缀的First集, 再按强连通分量的拓扑序求解
+def constructFollowMask(rules:dict[VN,Rule], First:dict[VN, int], beginning:VN):
+    base:dict[VN,int] = {vn: 0 for vn in rules}
+    deps:dict[VN,set] = {vn: set() for vn in rules}
+
     # 在开始文法中加入$，表示结束
-    for vn in rules:
-        Follow[vn] = set()
+    base[beginning] |= END_BIT
 
-    Follow[beginning].add(END)
+    for parentVN in rules:
+        rule = rules[parentVN]
 
-    while updated:
-        updated = False
-        # printFirst(Follow)
-        for parentVN in rules:
-            rule = rules[parentVN]
+        for child in rule.children:
+            # 后缀的First集(不含Epsilon), 以及后缀是否可空
+            trailer = 0
+            trailerNullable = True
 
-            # 所有规则中
-            for child in rule.children:
+            for token in reversed(child):
+                if token == EPSILON:
+                    continue
 
-                # 空产生式不处理
-                if child[0] == EPSILON:
+                if isinstance(token, VT):
+                    trailer = token.bit
+                    trailerNullable = False
                     continue
 
-                # A ： a B b , a的Follow集合增加First(Bb)
-                for i in range(len(child)-1):
-                    if isinstance(child[i], VN):
-                        updated = True if updateSet(Follow[child[i]], getFirstOfSeq(First, child[i+1:]), True) else updated
+                base[token] |= trailer
+                if trailerNullable and token != parentVN:
+                    deps[token].add(parentVN)
 
-                #如果b ： Epsilon, B的Follow集增加Follow(A)
-                for i in range(len(child)-1, 0, -1):
-                    if isinstance(child[i], VN):
-                        if EPSILON in getFirstOfSeq(First,child[i+1:]):
-                            updated = True if updateSet(Follow[child[i]], Follow[parentVN], True) else updated
+                firstOfToken = First[token]
+                if firstOfToken & EPSILON_BIT:
+                    trailer |= firstOfToken & ~EPSILON_BIT
+                else:
+                    trailer = firstOfToken
+                    trailerNullable = False
 
+    return solveSetEquations(rules, base, deps)
 
-    return Follow
 
+# 构造Follow集
+def constructFollowSet(rules:dict[VN,Rule], First:dict[VN, VT], beginning:VN):
+    FirstMask = {vn: VT_INDEX.toMask(First[vn]) for vn in First}
+    Follow = constructFollowMask(rules, FirstMask, beginning)
+    return {vn: VT_INDEX.toSet(mask) for vn, mask in Follow.items()}
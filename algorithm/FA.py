@@ -1,115 +1,359 @@
-from entity.Graph import DirectedGraph, Edge, Node
-from entity.FA import DFA
-nodeIdx = 0
+from entity.FA import DFA, NFA, MNFA
+from entity.Token import VT
+from entity.Lexer import Lexer
+from algorithm.Common import stronglyConnectedComponents
 
-class Stack(list):
-    def __init__(self, e=None) -> None:
-        if not e:
-            super().__init__()
-        else:
-            super().__init__(e)
+# 转义序列, 其余字符转义后为其本身, 如 \* \[ \,
+ESCAPES = {'n': '\n', 't': '\t', 'r': '\r'}
 
-    def tail(self) :
-        return self.__getitem__(-1)
 
-def RegExpToDFA(pattern:str)->DFA:
-    """RegExpToDFA 正则表达式，先构建NFA，再构造DFA
-        支持的正则表达式语法, *:匹配0,1,n次, +:匹配1,n次, ?:匹配0,1次, [a,b]:匹配a或者b, ()分组
-        后续需要添加对转义字符的支持
-        使用栈来处理正则表达式语法
-        正则表达式构造NFA:
-            1) ab : a前后增加两个状态 0-a->1-epsilon->2-b->3
-            2) a[b,c]d : abd构造边, acd构造边
-            3) (ab)前后各加两个状态, 转化为a类似的
-    """ 
-    def addNode():
-        global nodeIdx
-        node = Node(nodeIdx)
-        nodeIdx += 1
-        return node
-
-    def addEdge(graph,head,tail,tag=None) -> Edge:
-        if head is None:
-            head = addNode()
-        if tail is None:
-            tail = addNode()
-
-        edge = Edge(head,tail, tag)
-        if graph:
-            graph.addEdge(edge)
-        return edge
-
-    graph = DirectedGraph()
-
-    edge = addEdge(graph,None,None,'')    
-    edgeStack = Stack([(edge.head, edge)])
-    nodeStack:Stack[Node] = Stack()
-
-    for c in pattern:
+class RegExpParser:
+    """ 正则表达式语法分析, 同时用Thompson构造法生成NFA, 每个字符只处理一次, 状态数与模式长度成线性关系
+        支持的正则表达式语法, *:匹配0,1,n次, +:匹配1,n次, ?:匹配0,1次, [a,b]:匹配a或者b, ()分组, \\转义
+        [a,b]中的a, b可以是任意正则表达式, 方括号外的逗号为普通字符
+        每个子表达式对应一个片段 (start, end), end为新建的状态, 尚无出边, 连接时为其添加空边
+        状态保存在nfa中, 不使用全局变量, 多个模式可以生成到同一个NFA中
+    """
+    def __init__(self, pattern: str, nfa: NFA) -> None:
+        self.pattern = pattern
+        self.pos = 0
+        self.nfa = nfa
+
+    def error(self, message: str):
+        raise Exception('正则表达式错误: %s, 位置 %d, 模式 %s' % (message, self.pos, self.pattern))
+
+    def parse(self) -> tuple[int, int]:
+        fragment = self.parseSequence()
+        if self.pos < len(self.pattern):
+            self.error('多余的 %s' % self.pattern[self.pos])
+        return fragment
+
+    def parseSequence(self, inBracket: bool = False) -> tuple[int, int]:
+        # 连接: 前一个片段的end通过空边连接到后一个片段的start
+        nfa = self.nfa
+        start = end = nfa.addState()
+        pattern = self.pattern
+        while self.pos < len(pattern):
+            c = pattern[self.pos]
+            if c == ')' or c == ']' or (c == ',' and inBracket):
+                break
+            atomStart, atomEnd = self.parsePostfix(self.parseAtom())
+            nfa.out1[end] = atomStart
+            end = atomEnd
+        return start, end
+
+    def parseAtom(self) -> tuple[int, int]:
+        nfa = self.nfa
+        pattern = self.pattern
+        c = pattern[self.pos]
+        self.pos += 1
+
         if c == '(':
-            # 保存起始点
-            edge = addEdge(graph,None,None,'')
-
-            head, prevEdge = edgeStack.pop()
-            addEdge(graph,prevEdge.tail,edge.head,'')
-
-            edgeStack.append((head,edge))
-            nodeStack.append(edge.head)
-
-        elif c == ')':
-            # 虚边 仅表示head可以到达tail
-            head, prevEdge = edgeStack.pop()
-            edge = Edge(nodeStack.pop(), prevEdge.tail)
-            edgeStack.append((head,edge))
-
-        elif c == '[':
-            edgeStack.append(c)
-            edge = addEdge(graph,None,None,'')
-            edgeStack.append((edge.head, edge))
-
-        elif c == ']':
-            tailEdge = addEdge(graph,None,None,'')
-            headEdge = addEdge(graph,None,None,'')
-            # 向前寻找prevEdge
-            while edgeStack.tail() != '[':
-                head, edge = edgeStack.pop()
-                addEdge(graph, headEdge.tail, head, '')
-                addEdge(graph, edge.tail, tailEdge.head, '')
-            edgeStack.pop()
-            head, prevEdge = edgeStack.pop()
-            addEdge(graph, prevEdge.tail, headEdge.head, '')
-            edgeStack.append((head, tailEdge))
-            
-        elif c == ',':
-            edge = addEdge(graph,None,None,'')
-            edgeStack.append((edge.head, edge))
-
-        elif c == '?':
-            head, edge = edgeStack.pop()
-            edgeStack.append((head, addEdge(graph, edge.head, edge.tail, '')))
-
-        elif c == '*':
-            head, edge = edgeStack.pop()
-            addEdge(graph, edge.tail, edge.head, '')
-            edgeStack.append((head,addEdge(graph, edge.head, None, '')))
-
-        elif c == '+':
-            head, edge = edgeStack.pop()
-            addEdge(graph, edge.tail, edge.head, '')
-            edgeStack.append((head, addEdge(graph, edge.tail, None, '')))
-
-        else:
-            # 为c创建首尾状态,然后与旧状态连接
-            edge = addEdge(graph,None,None,c)
-            head, prevEdge =  edgeStack.pop()
-            addEdge(graph, prevEdge.tail, edge.head, '')
-
-            edgeStack.append((head,edge))
-
-    graph.visualize()
-    assert len(nodeStack) == 0
-    assert len(edgeStack) == 1
-    _, edge = edgeStack.pop()
-
-    acceptedState = edge.tail
+            fragment = self.parseSequence()
+            if self.pos >= len(pattern) or pattern[self.pos] != ')':
+                self.error('缺少 )')
+            self.pos += 1
+            return fragment
+
+        if c == '[':
+            # 分支: 空边链依次指向每个分支的start, 每个分支的end指向同一个新状态
+            branches = [self.parseSequence(True)]
+            while self.pos < len(pattern) and pattern[self.pos] == ',':
+                self.pos += 1
+                branches.append(self.parseSequence(True))
+            if self.pos >= len(pattern) or pattern[self.pos] != ']':
+                self.error('缺少 ]')
+            self.pos += 1
+
+            end = nfa.addState()
+            start = split = nfa.addState(out1=branches[0][0])
+            nfa.out1[branches[0][1]] = end
+            for branchStart, branchEnd in branches[1:]:
+                nextSplit = nfa.addState(out1=branchStart)
+                nfa.out2[split] = nextSplit
+                nfa.out1[branchEnd] = end
+                split = nextSplit
+            return start, end
+
+        if c in '*+?':
+            self.error('%s 之前没有表达式' % c)
+        if c in ')]':
+            self.error('多余的 %s' % c)
+
+        if c == '\\':
+            if self.pos >= len(pattern):
+                self.error('转义符在结尾')
+            c = ESCAPES.get(pattern[self.pos], pattern[self.pos])
+            self.pos += 1
+
+        end = nfa.addState()
+        return nfa.addState(c, end), end
+
+    def parsePostfix(self, fragment: tuple[int, int]) -> tuple[int, int]:
+        nfa = self.nfa
+        pattern = self.pattern
+        while self.pos < len(pattern) and pattern[self.pos] in '*+?':
+            c = pattern[self.pos]
+            self.pos += 1
+            start, end = fragment
+            newEnd = nfa.addState()
+            if c == '*':
+                # split -> start | newEnd, end -> split
+                split = nfa.addState(out1=start, out2=newEnd)
+                nfa.out1[end] = split
+                fragment = (split, newEnd)
+            elif c == '+':
+                # end -> start | newEnd
+                nfa.out1[end] = start
+                nfa.out2[end] = newEnd
+                fragment = (start, newEnd)
+            else:
+                # split -> start | newEnd, end -> newEnd
+                split = nfa.addState(out1=start, out2=newEnd)
+                nfa.out1[end] = newEnd
+                fragment = (split, newEnd)
+        return fragment
+
+
+# 预先计算每个状态的空边闭包, 闭包中只保留有出边符号的状态与接收状态, 结果为排序后的元组
+# 空边构成的图按强连通分量的拓扑序处理, 环中的状态闭包相同, 每条空边只处理一次
+def epsilonClosures(nfa: NFA) -> list[tuple]:
+    symbol, out1, out2 = nfa.symbol, nfa.out1, nfa.out2
+    edges = {state: [target for target in (out1[state], out2[state]) if target >= 0] for state in range(nfa.stateCount()) if not symbol[state]}
+
+    closures: list[tuple] = [None] * nfa.stateCount()
+    for component in stronglyConnectedComponents(range(nfa.stateCount()), edges):
+        members = set(component)
+        result = set(state for state in component if symbol[state] or state in nfa.acceptedState)
+        for state in component:
+            for target in edges.get(state, ()):
+                if target not in members:
+                    result.update(closures[target])
+
+        key = tuple(sorted(result))
+        for state in component:
+            closures[state] = key
+    return closures
+
+
+def subsetConstruction(nfa: NFA):
+    """subsetConstruction 子集法构造DFA
+        DFA状态为NFA状态集合(排序后的元组), 只包含有出边符号的状态与接收状态, 两个集合相同即为同一状态
+        每个DFA状态一遍扫描其NFA状态, 按符号分组得到后继集合, 只处理实际出现的符号, 耗时与输出的规模成正比
+
+    Returns:
+        stateMap: DFA状态转移表 {状态: {符号: 状态}}, 初始状态为0
+        states: states[i]为DFA状态i对应的NFA状态元组
+    """
+    closures = epsilonClosures(nfa)
+    symbol, out1 = nfa.symbol, nfa.out1
+
+    head = closures[nfa.beginningState]
+    statesToIdx: dict[tuple, int] = {head: 0}
+    states: list[tuple] = [head]
+    stateMap: dict[int, dict[str, int]] = dict()
+
+    idx = 0
+    while idx < len(states):
+        moves: dict[str, set] = dict()
+        for state in states[idx]:
+            c = symbol[state]
+            if c:
+                targets = moves.get(c)
+                if targets is None:
+                    targets = moves[c] = set()
+                targets.update(closures[out1[state]])
+
+        row = dict()
+        for c, targets in moves.items():
+            key = tuple(sorted(targets))
+            nextIdx = statesToIdx.get(key)
+            if nextIdx is None:
+                nextIdx = statesToIdx[key] = len(states)
+                states.append(key)
+            row[c] = nextIdx
+        stateMap[idx] = row
+        idx += 1
+
+    return stateMap, states
+
+
+def refinePartition(stateCount: int, inverse: list[dict], blocks: list[list[int]]) -> list[int]:
+    """refinePartition Hopcroft划分求精, 耗时 O(n·k·log n)
+        每次取出待处理的块A, 按符号c求出经c转移到A中的状态集X, 将与X相交但不包含于X的块一分为二
+        被分割的块若已在待处理集合中则两半都要处理, 否则只需处理较小的一半
+
+    Args:
+        stateCount (int): 状态数, 状态为 0..n-1, 转移必须是完全的
+        inverse (list[dict]): inverse[t]为 {符号: [经该符号转移到t的状态]}
+        blocks (list[list[int]]): 初始划分, 不同块中的状态一定不等价
+
+    Returns:
+        list[int]: 每个状态所在块的编号, 编号相同的状态等价
+    """
+    blockOf = [0] * stateCount
+    members: list[set] = []
+    for states in blocks:
+        for state in states:
+            blockOf[state] = len(members)
+        members.append(set(states))
+
+    # 初始时除最大的块外都要处理
+    largest = max(range(len(members)), key=lambda b: len(members[b]), default=0)
+    waiting = [b for b in range(len(members)) if b != largest]
+    isWaiting = [b != largest for b in range(len(members))]
+
+    while waiting:
+        a = waiting.pop()
+        isWaiting[a] = False
+
+        # 按符号分组, 求出各符号的X, 块A在此之后被分割不影响本轮
+        predecessors: dict[str, list] = dict()
+        for target in members[a]:
+            for c, sources in inverse[target].items():
+                group = predecessors.get(c)
+                if group is None:
+                    predecessors[c] = list(sources)
+                else:
+                    group.extend(sources)
+
+        for sources in predecessors.values():
+            touched: dict[int, list] = dict()
+            for state in sources:
+                b = blockOf[state]
+                group = touched.get(b)
+                if group is None:
+                    touched[b] = [state]
+                else:
+                    group.append(state)
+
+            for b, split in touched.items():
+                if len(split) == len(members[b]):
+                    continue
+                newBlock = len(members)
+                members[b].difference_update(split)
+                members.append(set(split))
+                for state in split:
+                    blockOf[state] = newBlock
+
+                if isWaiting[b]:
+                    isWaiting.append(True)
+                    waiting.append(newBlock)
+                else:
+                    smaller = newBlock if len(split) <= len(members[b]) else b
+                    isWaiting.append(smaller == newBlock)
+                    isWaiting[b] = smaller == b
+                    waiting.append(smaller)
+
+    return blockOf
+
+
+def minimizeDFA(dfa: DFA) -> DFA:
+    """minimizeDFA 最小化DFA
+        去掉不可达状态, 补上隐含的死状态使转移完全, 按 非接收/各标记的接收状态 划分后用Hopcroft算法求精
+        与死状态等价的状态(无法到达接收状态)连同其入边一起删去, 结果仍是不完全的DFA
+        新状态按从初始状态出发的广度优先顺序编号为 0..m-1, 初始状态为0
+
+    Returns:
+        DFA: 与原DFA接受相同语言的最小DFA
+    """
+    stateMap = dfa.stateMap
+    # 可达状态, 重新编号为 0..n-1
+    order = [dfa.beginningState]
+    index = {dfa.beginningState: 0}
+    for state in order:
+        for target in stateMap[state].values():
+            if target not in index:
+                index[target] = len(order)
+                order.append(target)
+
+    chars = sorted(set(c for state in order for c in stateMap[state]))
+    dead = len(order)
+    stateCount = dead + 1
+    inverse: list[dict] = [dict() for _ in range(stateCount)]
+    for idx, state in enumerate(order):
+        row = stateMap[state]
+        for c in chars:
+            target = index[row[c]] if c in row else dead
+            sources = inverse[target].get(c)
+            if sources is None:
+                inverse[target][c] = [idx]
+            else:
+                sources.append(idx)
+    inverse[dead] = {c: [dead] + inverse[dead].get(c, []) for c in chars}
+
+    accepted = [idx for idx, state in enumerate(order) if state in dfa.acceptedState]
+    rejected = [idx for idx, state in enumerate(order) if state not in dfa.acceptedState] + [dead]
+    # 标记不同的接收状态一定不等价
+    groups = dict()
+    for idx in accepted:
+        groups.setdefault(dfa.tags.get(order[idx]), []).append(idx)
+    blockOf = refinePartition(stateCount, inverse, list(groups.values()) + [rejected])
+
+    # 按广度优先顺序给块编号, 跳过死状态所在的块
+    deadBlock = blockOf[dead]
+    representative = dict()
+    for idx in range(dead):
+        representative.setdefault(blockOf[idx], idx)
+
+    newIdx = {blockOf[0]: 0} if blockOf[0] != deadBlock else dict()
+    queue = list(newIdx)
+    newMap: dict[int, dict[str, int]] = dict()
+    for block in queue:
+        row = dict()
+        for c, target in sorted(stateMap[order[representative[block]]].items()):
+            targetBlock = blockOf[index[target]]
+            if targetBlock == deadBlock:
+                continue
+            if targetBlock not in newIdx:
+                newIdx[targetBlock] = len(queue)
+                queue.append(targetBlock)
+            row[c] = newIdx[targetBlock]
+        newMap[newIdx[block]] = row
+
+    if not newMap:
+        # 空语言
+        return DFA({0: dict()}, set(), 0)
+    acceptedState = set(newIdx[blockOf[idx]] for idx in accepted)
+    tags = {newIdx[blockOf[idx]]: dfa.tags[order[idx]] for idx in accepted if order[idx] in dfa.tags}
+    return DFA(newMap, acceptedState, 0, tags)
+
+
+def RegExpToNFA(pattern: str, nfa: NFA = None) -> NFA:
+    """RegExpToNFA 正则表达式构造NFA, 语法见RegExpParser
+
+    Args:
+        pattern (str): 正则表达式
+        nfa (NFA): 为None时新建NFA; 否则将状态加入该NFA, 并将其初始状态与接收状态设为本模式的
+
+    Returns:
+        NFA: 初始状态为模式的开始, 接收状态为模式的结束
+    """
+    if nfa is None:
+        nfa = NFA()
+    start, end = RegExpParser(pattern, nfa).parse()
+    nfa.beginningState = start
+    nfa.acceptedState = {end}
+    return nfa
+
+
+def RegExpToDFA(pattern: str) -> DFA:
+    """RegExpToDFA 正则表达式，先构建NFA，再构造DFA
+    """
+    return RegExpToNFA(pattern).toDFA()
+
+
+def constructLexer(rules: list[tuple[str, VT]]) -> Lexer:
+    """constructLexer 构造词法分析器
+        所有模式生成到同一个MNFA中, 确定化后按终结符划分接收状态并最小化, 只构造一次
+
+    Args:
+        rules (list[tuple[str, VT]]): (正则表达式, 终结符) 的列表, 靠前的优先级高, 终结符为None时匹配的内容被跳过
 
+    Returns:
+        Lexer: 词法分析器
+    """
+    nfa = MNFA()
+    for pattern, tag in rules:
+        nfa.addPattern(pattern, tag)
+    return Lexer(nfa.toDFA().minimize())
@@ -0,0 +1,143 @@
+from array import array
+import sys
+from entity.Token import VT
+from entity.LR1 import LR1_FSA
+from utils.columnFile import writeAtomic
+
+# 生成的分析器模块只依赖标准库
+# 分析表以小端字节串字面量保存, 导入时用array.frombytes直接还原
+PARSER_TEMPLATE = '''# 由pyLR生成的LR分析器, 请勿手动修改
+# 只依赖标准库, 输入为带有tag属性的终结符序列, 序列结束或遇到END时视为输入结束
+import sys
+from array import array
+
+
+def _table(data):
+    table = array('i')
+    table.frombytes(data)
+    if sys.byteorder != 'little':
+        table.byteswap()
+    return table
+
+
+class ParseError(Exception):
+    def __init__(self, position, token):
+        super().__init__('语法错误: 位置 %d, 符号 %s' % (position, getattr(token, 'tag', 'END')))
+        self.position = position
+        self.token = token
+
+
+INIT_STATE = {initState}
+TERMINALS = {terminals}
+NONTERMINALS = {nonterminals}
+# 产生式: (左部, 产生式体)
+PRODUCTIONS = {productions}
+
+TERMINAL_IDX = {{tag: idx for idx, tag in enumerate(TERMINALS)}}
+END_IDX = TERMINAL_IDX.get('END', -1)
+
+ACTION_BASE = _table({actionBase})
+ACTION_TABLE = _table({actionTable})
+ACTION_CHECK = {actionCheck}
+ACTION_DEFAULT = {actionDefault}
+GOTO_BASE = _table({gotoBase})
+GOTO_TABLE = _table({gotoTable})
+PROD_PARENT = _table({prodParent})
+PROD_LEN = _table({prodLen})
+
+
+def parse(tokens, reduce=None):
+    """parse 分析终结符序列
+
+    Args:
+        tokens: 终结符序列, 可以是任意可迭代对象
+        reduce: 规约时调用 reduce(产生式编号, 子节点列表), 返回值作为新节点
+            为None时新节点为 (左部, 子节点列表)
+
+    Returns:
+        语法树的根节点, 叶子节点为输入的终结符
+    """
+    terminalIdx, prodParent, prodLen, productions = TERMINAL_IDX, PROD_PARENT, PROD_LEN, PRODUCTIONS
+    actionBase, actionTable, actionCheck, actionDefault = ACTION_BASE, ACTION_TABLE, ACTION_CHECK, ACTION_DEFAULT
+    gotoBase, gotoTable = GOTO_BASE, GOTO_TABLE
+
+    stateStack = [INIT_STATE]
+    valueStack = []
+    tokenIter = iter(tokens)
+    position = 0
+    token = next(tokenIter, None)
+    column = END_IDX if token is None else terminalIdx.get(token.tag, -1)
+
+    while True:
+        state = stateStack[-1]
+        if column < 0:
+            raise ParseError(position, token)
+
+{actionLookup}
+
+        if value > 0:
+            stateStack.append(value - 1)
+            valueStack.append(token)
+            position += 1
+            token = next(tokenIter, None)
+            column = END_IDX if token is None else terminalIdx.get(token.tag, -1)
+
+        elif value < -1:
+            prod = -value - 2
+            length = prodLen[prod]
+            if length:
+                children = valueStack[-length:]
+                del valueStack[-length:]
+                del stateStack[-length:]
+            else:
+                children = []
+
+            valueStack.append((productions[prod][0], children) if reduce is None else reduce(prod, children))
+            stateStack.append(gotoTable[gotoBase[stateStack[-1]] + prodParent[prod]])
+
+        elif value == -1:
+            return valueStack[-1]
+
+        else:
+            raise ParseError(position, token)
+'''
+
+DENSE_LOOKUP = '''        value = actionTable[actionBase[state] + column]'''
+
+COMPRESSED_LOOKUP = '''        pos = actionBase[state] + column
+        value = actionTable[pos] if actionCheck[pos] == state else actionDefault[state]'''
+
+
+def tableLiteral(data) -> str:
+    table = array('i', data)
+    if sys.byteorder != 'little':
+        table.byteswap()
+    return repr(table.tobytes())
+
+
+# 生成独立的分析器模块, 分析表为字面量, 分析循环根据是否压缩生成不同的查表代码
+# 生成的模块不依赖本项目, 可以在不安装graphviz的进程中直接导入
+def generateParser(fsa:LR1_FSA, path:str, compress:bool = True):
+    table = fsa.table if fsa.table is not None and fsa.table.compressed == compress else fsa.compile(compress)
+
+    def symbol(token):
+        return ('T' if isinstance(token, VT) else 'N', token.tag)
+
+    source = PARSER_TEMPLATE.format(
+        initState=table.initState,
+        terminals=repr(tuple(vt.tag for vt in table.terminals)),
+        nonterminals=repr(tuple(vn.tag for vn in table.nonterminals)),
+        productions=repr(tuple((rule.parent.tag, tuple(symbol(token) for token in rule.child)) for rule in table.productions)),
+        actionBase=tableLiteral(table.actionBase),
+        actionTable=tableLiteral(table.actionTable),
+        actionCheck='_table(%s)' % tableLiteral(table.actionCheck) if table.compressed else 'None',
+        actionDefault='_table(%s)' % tableLiteral(table.actionDefault) if table.compressed else 'None',
+        gotoBase=tableLiteral(table.gotoBase),
+        gotoTable=tableLiteral(table.gotoTable),
+        prodParent=tableLiteral(table.prodParent),
+        prodLen=tableLiteral(table.prodLen),
+        actionLookup=COMPRESSED_LOOKUP if table.compressed else DENSE_LOOKUP,
+    )
+
+    writeAtomic(path, (source.encode('utf-8'),))
+    return path
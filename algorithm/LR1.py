@@ -1,172 +1,686 @@
 from entity.Graph import IndexedSet
 from typing import Iterable
-from entity.Token import Token, VN, VT, EPSILON, END
-from entity.Rule import Rule, SingleRule
-from entity.LR1 import Action, ActionKind,  ItemSet,Item,ItemExtends, LR1_FSA
-from algorithm.Common import constructFirstSet, getFirstOfSeq
+from entity.Token import Token, VN, END, VT_INDEX, EPSILON_BIT, END_BIT
+from entity.Rule import Rule, Grammar
+from entity.LR1 import Action, ActionKind, ItemSet, LR1_FSA, LazyLR1_FSA, LR1BuildCache, LRMode, Conflict, ConflictKind, ConflictError
+from entity.Table import ParseTable, FORMAT_VERSION, dumpSymbol
+from algorithm.Common import constructFirstMask, getFirstMaskOfSeq, updateMask, updateFirstMask
+import hashlib
+import json
+import multiprocessing
+import os
 import queue
-import graphviz
+import time
+import tracemalloc
+
+# 项目均为Grammar中的项目编号, 展望符集合均为终结符位掩码
+# restFirst[item]为项目nextToken之后序列的First集, 可空时包含EPSILON_BIT
+# 已删除的产生式(见Grammar的previous参数)的项目不再使用, 记为0
+def constructRestFirst(grammar:Grammar, First:dict[VN, int]):
+    return [getFirstMaskOfSeq(First, grammar.itemRest(item)) if grammar.prodLive[grammar.itemProd[item]] else 0 for item in range(grammar.itemCount())]
+
+
+# 闭包模板: 对每个非终结符A, 预先计算 A 的LR(0)闭包中每个项目的展望符
+# 展望符中的EPSILON_BIT表示该项目继承A之后的展望符(传播), 其余位为自生展望符
+# templates[A] = [(项目, 展望符), ...]
+def constructClosureTemplates(grammar:Grammar, restFirst:list[int]):
+    return {vn: constructClosureTemplate(grammar, restFirst, vn) for vn in grammar.prodOf}
+
+
+def constructClosureTemplate(grammar:Grammar, restFirst:list[int], vn:VN):
+    # 可由A推导出的非终结符C -> C的产生式的展望符
+    expected = {vn: EPSILON_BIT}
+    worklist = [vn]
+    while worklist:
+        parentVN = worklist.pop()
+        for prod in grammar.prodOf[parentVN]:
+            item = grammar.itemStart[prod]
+            nextToken = grammar.itemNext[item]
+            if not isinstance(nextToken, VN):
+                continue
 
-def closure(rules:dict[VN, Rule], First:dict[VN, VT], coreToExpectedVT:dict[Item, set[VT]]):
-    if not coreToExpectedVT:
-        return None
+            followMask = restFirst[item]
+            if followMask & EPSILON_BIT:
+                followMask = (followMask & ~EPSILON_BIT) | expected[parentVN]
 
-    # 计算项目闭包
-    updated = True
-    while updated:
-        updated = False
+            merged, changed = updateMask(expected.get(nextToken, 0), followMask)
+            if changed or nextToken not in expected:
+                expected[nextToken] = merged
+                worklist.append(nextToken)
 
-        tmpCoreToExpectedVT = dict()
+    return [(grammar.itemStart[prod], expected[derivedVN]) for derivedVN in expected for prod in grammar.prodOf[derivedVN]]
 
-        # dict在运行时不允许修改, 重新设计更新算法
-        for item in coreToExpectedVT:
-            if isinstance(item.nextToken(), VN):
-                rule = rules[item.nextToken()]
-                for child in rule.children:
 
-                    # 还是需要改变, 展望符作为follow集后加进去
-                    followSet = getFirstOfSeq(First, item.restToken(), coreToExpectedVT[item])
-                    derivedItem = Item(SingleRule(rule.parent,child), 0)
+# 计算项目闭包
+# 对核心项目 B : a ~ A b, (L), 查表得到A的闭包模板, 模板中的传播项目展望符替换为First(b L)
+# 只需一遍扫描, 无需迭代
+def closure(grammar:Grammar, restFirst:list[int], templates:dict[VN, list[tuple[int, int]]], coreToExpectedVT:dict[int, int]):
+    if not coreToExpectedVT:
+        return None
 
-                    if derivedItem not in coreToExpectedVT:
-                        tmpCoreToExpectedVT[derivedItem] = followSet
-                        updated = True
-                        continue
+    result = dict(coreToExpectedVT)
+    for item in coreToExpectedVT:
+        template = templates.get(grammar.itemNext[item])
+        if template is None:
+            continue
 
-                    if not followSet.issubset(coreToExpectedVT[derivedItem]):
-                        tmpCoreToExpectedVT[derivedItem] = coreToExpectedVT[derivedItem] | followSet
-                        updated = True
-        
-        for item in tmpCoreToExpectedVT:
-            coreToExpectedVT[item] = tmpCoreToExpectedVT[item]
-    
-    return [ItemExtends(item.rule,item.pos, coreToExpectedVT[item]) for item in coreToExpectedVT]
+        # 展望符作为follow集后加进去
+        followMask = restFirst[item]
+        if followMask & EPSILON_BIT:
+            followMask = (followMask & ~EPSILON_BIT) | coreToExpectedVT[item]
 
+        for derivedItem, expectedMask in template:
+            if expectedMask & EPSILON_BIT:
+                expectedMask = (expectedMask & ~EPSILON_BIT) | followMask
+            result[derivedItem] = result.get(derivedItem, 0) | expectedMask
 
-# 计算某一项目的后继派生
-def deriveItemSet(rules:dict[VN, Rule], First:dict[VN, VT], itemSet:ItemSet, tokens:Iterable):
-    results = dict()
-    for token in tokens:
-        coreToExpectedVT:dict[Item, set[VT]] = dict()
-        for curItem in itemSet.items:
-            if token is not curItem.nextToken():
-                continue
+    return result
 
-            # 接收nextToken, 状态转移, pos+1, 展望符不变
-            newItemSet = Item(curItem.rule, curItem.pos+1)
-            if newItemSet not in coreToExpectedVT:
-                coreToExpectedVT[newItemSet] = set()
-            coreToExpectedVT[newItemSet] |= itemSet.items[curItem]
 
-        
-        if not coreToExpectedVT:
-            results[token] = None
+# 计算项目集(含闭包项目)在每个符号上的后继核心项目, 展望符不变
+def successorKernels(grammar:Grammar, items:dict[int, int]):
+    successors:dict[Token, dict[int, int]] = dict()
+    for item in items:
+        nextToken = grammar.itemNext[item]
+        if nextToken is None:
             continue
+        kernel = successors.get(nextToken)
+        if kernel is None:
+            kernel = successors[nextToken] = dict()
+        kernel[item + 1] = kernel.get(item + 1, 0) | items[item]
+    return successors
 
-        results[token] = ItemSet(closure(rules,First,coreToExpectedVT))
 
-    return results
+# 计算某一项目集的后继核心项目
+# 一遍扫描按nextToken分桶, 只包含实际出现的符号, 不计算闭包
+# tokenIdx为 {符号: 序号}, 结果按序号排列, 不在tokenIdx中的符号忽略
+def deriveItemSet(grammar:Grammar, itemSet:ItemSet, tokenIdx:dict[Token, int]):
+    successors = successorKernels(grammar, itemSet.items)
+    order = sorted((tokenIdx[token], token) for token in successors if token in tokenIdx)
+    return {token: successors[token] for _, token in order}
+
+def visLR1(states:list[ItemSet], transitions:list[dict[Token, int]]):
+    # 仅在绘图时依赖graphviz
+    import graphviz
 
-def visLR1(transformMap:dict[ItemSet,dict[object,ItemSet]], itemSetToIdx:IndexedSet):
     e = graphviz.Digraph('ER', filename='er.gv', engine='dot',graph_attr={'size':'100,50'})
     # e.attr(rankdir='LR')
     e.attr('node', shape='box')
 
-    for srcItemSet in transformMap:
-        e.node('%d' % itemSetToIdx.getIdx(srcItemSet), label='P%d\n%s' % (itemSetToIdx.getIdx(srcItemSet), str(srcItemSet)), fontsize='6')
+    for idx, itemSet in enumerate(states):
+        e.node('%d' % idx, label='P%d\n%s' % (idx, str(itemSet)), fontsize='6')
 
-    for srcItemSet in transformMap:
-        for token in transformMap[srcItemSet]:
-            dstItemSet = transformMap[srcItemSet][token]
-            if dstItemSet:
-                e.edge('%d' % itemSetToIdx.get(srcItemSet),'%d' % itemSetToIdx.getIdx(dstItemSet), token.tag, fontsize='6', arrowsize='1.0')
+    for idx, row in enumerate(transitions):
+        for token in row:
+            e.edge('%d' % idx,'%d' % row[token], token.tag, fontsize='6', arrowsize='1.0')
 
     e.render(filename='LR1', view=True, format='pdf')
 
-# 构建LR(1)自动机
-def constructLR1(rules:dict[VN, Rule], beginning:VN, tokens:Iterable[Token]):
-    # 自动机定义
-    # 动作状态
-
-    # 项目集定义
-    # 构造First集合
-    First = constructFirstSet(rules)
-
-    # 将终结符放入开始文法
-    assert len(rules[beginning].children) == 1
-    child = list(rules[beginning].children)[0]
-
-    #  E_ : E
-
-    def printItemSet(itemSet:ItemSet):
-        print('ItemSet begin')
-        if itemSet is not None:
-            print(str(itemSet))
-        print('ItemSet end\n')
 
+# 构造规范LR(1)项目集族
+# 状态按核心项目去重, 只有新出现的核心才计算闭包
+# 返回项目集列表与状态转移表, transitions[i]为 {token: 后继状态编号}
+def constructCanonicalCollection(grammar:Grammar, restFirst:list[int], templates:dict[VN, list[tuple[int, int]]], tokens:Iterable[Token]):
     # 计算开始项目集
-    headItemSet = ItemSet(closure(rules, First, {Item(SingleRule(rules[beginning].parent, child),0):set([END,])}))
-    printItemSet(headItemSet)
+    headKernel = {grammar.itemStart[0]: END_BIT}
+    headItemSet = ItemSet(grammar, closure(grammar, restFirst, templates, headKernel), ItemSet.kernelKey(headKernel))
 
     # 计算后继项目集，并不断更新，直到没有新的项目集出现
+    # indexedSet中为核心项目元组, states[i]为第i个核心对应的项目集
     indexedSet = IndexedSet()
+    states:list[ItemSet] = [headItemSet]
     itemSetQueue:queue.Queue[ItemSet] = queue.Queue()
-    indexedSet.add(headItemSet)
-
+    indexedSet.add(headItemSet.key)
     itemSetQueue.put(headItemSet)
-    # 记录状态转移表
-    # src 与 dst分别为项目集, token为vn或者vt
-    # {src: token -> dst}
-    transformMap:dict[ItemSet,dict[object,ItemSet]] = dict()
+
+    # 状态按编号顺序出队, transitions的下标即为状态编号
+    transitions:list[dict[Token, int]] = list()
+    tokenIdx = {token: idx for idx, token in enumerate(tokens)}
 
     while not itemSetQueue.empty():
         itemSet = itemSetQueue.get()
-        token_to_itemSet = deriveItemSet(rules,First,itemSet,tokens)
-        transformMap[itemSet] = dict()
-        for token in token_to_itemSet:
-            nextItemSet = token_to_itemSet[token]
-            transformMap[itemSet][token] = nextItemSet
-            if nextItemSet is not None and nextItemSet not in indexedSet:
-                indexedSet.add(nextItemSet)
+        row = dict()
+        for token, kernel in deriveItemSet(grammar, itemSet, tokenIdx).items():
+            key = ItemSet.kernelKey(kernel)
+            if key not in indexedSet:
+                nextItemSet = ItemSet(grammar, closure(grammar, restFirst, templates, kernel), key)
+                indexedSet.add(key)
+                states.append(nextItemSet)
                 itemSetQueue.put(nextItemSet)
-                print(str(token))
-                printItemSet(nextItemSet)
-    # 打印结果
-    visLR1(transformMap, indexedSet)
+            row[token] = indexedSet.getIdx(key)
+        transitions.append(row)
+
+    return states, transitions
+
+
+# 并行构造时工作进程使用的 (grammar, restFirst, templates, tokenIdx), 每个进程只传递一次
+# fork方式下在创建进程池之前赋值, 子进程直接继承
+workerContext:tuple = None
+# 每层待扩展的状态数少于该值时在当前进程中扩展, 避免进程间通信的开销
+PARALLEL_MIN_FRONTIER = 64
+
+def initConstructWorker(context:tuple):
+    global workerContext
+    workerContext = context
+
+
+# 扩展一个状态, 输入与输出均为整数元组, 便于在进程间传递
+# kernel为排序后的 ((核心项目, 展望符), ...), 返回闭包项目与 [(符号在tokens中的下标, 后继核心), ...]
+def expandKernel(kernel:tuple):
+    grammar, restFirst, templates, tokenIdx = workerContext
+    items = closure(grammar, restFirst, templates, dict(kernel))
+    successors = [(tokenIdx[token], ItemSet.kernelKey(successor)) for token, successor in successorKernels(grammar, items).items() if token in tokenIdx]
+    successors.sort()
+    return tuple(items.items()), successors
+
+
+# 并行构造规范LR(1)项目集族
+# 按广度优先的层次扩展, 每层的所有状态在进程池中并行计算闭包与后继核心, 由主进程统一去重
+# 闭包由核心唯一确定, 因此按核心去重即可; 每层按顺序处理结果, 状态编号与constructCanonicalCollection相同
+def constructCanonicalCollectionParallel(grammar:Grammar, restFirst:list[int], templates:dict[VN, list[tuple[int, int]]], tokens:Iterable[Token], workers:int):
+    global workerContext
+    tokens = list(tokens)
+    context = (grammar, restFirst, templates, {token: idx for idx, token in enumerate(tokens)})
+
+    # 小的层在当前进程中扩展, fork方式创建的工作进程同样继承该上下文
+    workerContext = context
+
+    # 进程池在第一次遇到足够大的层时才创建, 小文法不启动工作进程
+    def createPool():
+        if 'fork' in multiprocessing.get_all_start_methods():
+            return multiprocessing.get_context('fork').Pool(workers)
+        return multiprocessing.Pool(workers, initConstructWorker, (context,))
+
+    kernels = IndexedSet()
+    kernels.add(((grammar.itemStart[0], END_BIT),))
+    closures:list[tuple] = list()
+    transitions:list[dict[Token, int]] = list()
+    stats = {'levels': 0, 'parallelLevels': 0}
+    pool = None
+
+    try:
+        frontier = [kernels[0]]
+        while frontier:
+            stats['levels'] += 1
+            if len(frontier) >= PARALLEL_MIN_FRONTIER:
+                stats['parallelLevels'] += 1
+                if pool is None:
+                    pool = createPool()
+                results = pool.map(expandKernel, frontier, max(1, len(frontier) // (workers * 4)))
+            else:
+                results = map(expandKernel, frontier)
+
+            frontier = list()
+            for items, successors in results:
+                closures.append(items)
+                row = dict()
+                for idx, kernel in successors:
+                    if kernel not in kernels:
+                        kernels.add(kernel)
+                        frontier.append(kernel)
+                    row[tokens[idx]] = kernels.getIdx(kernel)
+                transitions.append(row)
+    finally:
+        if pool is not None:
+            pool.terminate()
+        workerContext = None
+
+    states = [ItemSet(grammar, dict(items), kernels[state]) for state, items in enumerate(closures)]
+    return states, transitions, stats
+
+
+# 构造LALR(1)项目集族
+# 先构造LR(0)核心项目集族, 再计算核心项目的自生展望符与传播关系, 传播至不动点
+# 不需要构造规范LR(1)项目集族
+def constructLALRCollection(grammar:Grammar, restFirst:list[int], templates:dict[VN, list[tuple[int, int]]], tokens:Iterable[Token]):
+    # LR(0)项目集族, 状态以排序后的核心项目元组表示
+    kernels = IndexedSet()
+    kernels.add((grammar.itemStart[0],))
+    transitions:list[dict[Token, int]] = list()
+
+    idx = 0
+    while idx < len(kernels):
+        # 展望符为空的闭包即为LR(0)闭包
+        successors:dict[Token, list[int]] = dict()
+        for item in closure(grammar, restFirst, templates, dict.fromkeys(kernels[idx], 0)):
+            nextToken = grammar.itemNext[item]
+            if nextToken is not None:
+                successors.setdefault(nextToken, []).append(item + 1)
+
+        row = dict()
+        for token in tokens:
+            if token in successors:
+                kernel = tuple(sorted(successors[token]))
+                kernels.add(kernel)
+                row[token] = kernels.getIdx(kernel)
+        transitions.append(row)
+        idx += 1
+
+    # 以EPSILON_BIT作为标记计算每个核心项目的闭包
+    # 闭包项目的展望符中, EPSILON_BIT表示由该核心项目传播而来, 其余为自生展望符
+    expected:list[dict[int, int]] = [dict.fromkeys(kernel, 0) for kernel in kernels]
+    expected[0][grammar.itemStart[0]] = END_BIT
+    propagation:dict[tuple[int, int], list[tuple[int, int]]] = dict()
+
+    for state in range(len(kernels)):
+        for kernelItem in kernels[state]:
+            for item, mask in closure(grammar, restFirst, templates, {kernelItem: EPSILON_BIT}).items():
+                target = transitions[state].get(grammar.itemNext[item])
+                if target is None:
+                    continue
+                expected[target][item + 1] |= mask & ~EPSILON_BIT
+                if mask & EPSILON_BIT:
+                    propagation.setdefault((state, kernelItem), []).append((target, item + 1))
+
+    # 传播展望符直到不再更新
+    worklist = [(state, item) for state in range(len(kernels)) for item in expected[state] if expected[state][item]]
+    while worklist:
+        state, item = worklist.pop()
+        mask = expected[state][item]
+        for target, targetItem in propagation.get((state, item), ()):
+            merged, changed = updateMask(expected[target][targetItem], mask)
+            if changed:
+                expected[target][targetItem] = merged
+                worklist.append((target, targetItem))
+
+    states = [ItemSet(grammar, closure(grammar, restFirst, templates, expected[state])) for state in range(len(kernels))]
+    return states, transitions
+
+
+# Pager弱相容判定, 两个核心相同的状态合并后不会引入新的规约-规约冲突
+# 对任意 i != j, 要么 (A_i ∩ B_j) ∪ (B_i ∩ A_j) 为空, 要么 A_i ∩ A_j 或 B_i ∩ B_j 非空
+def isWeaklyCompatible(core:tuple, expectedA:dict[int, int], expectedB:dict[int, int]):
+    for i in range(len(core)):
+        a_i, b_i = expectedA[core[i]], expectedB[core[i]]
+        for j in range(i + 1, len(core)):
+            a_j, b_j = expectedA[core[j]], expectedB[core[j]]
+            if (a_i & b_j) | (b_i & a_j) and not (a_i & a_j) and not (b_i & b_j):
+                return False
+    return True
+
+
+# 构造Pager最小LR(1)项目集族
+# 在构造过程中将新的核心项目集合并进核心相同且弱相容的已有状态, 不构造完整的规范LR(1)项目集族
+# 已有状态的展望符扩大后重新计算其后继; 最后删除不可达状态并重新编号
+def constructPagerCollection(grammar:Grammar, restFirst:list[int], templates:dict[VN, list[tuple[int, int]]], tokens:Iterable[Token]):
+    kernels:list[dict[int, int]] = [{grammar.itemStart[0]: END_BIT}]
+    coreToStates:dict[tuple, list[int]] = {(grammar.itemStart[0],): [0]}
+    transitions:list[dict[Token, int]] = [dict()]
+    stats = {'created': 1, 'reused': 0, 'merged': 0, 'expanded': 0}
+
+    stateQueue = queue.deque([0])
+    queued = {0}
+
+    while stateQueue:
+        state = stateQueue.popleft()
+        queued.discard(state)
+        stats['expanded'] += 1
+
+        successors = successorKernels(grammar, closure(grammar, restFirst, templates, kernels[state]))
+        row = dict()
+        for token in tokens:
+            kernel = successors.get(token)
+            if kernel is None:
+                continue
 
-    # 生成自动机
-    stateToAction:dict[int, dict[Token, Action]] = dict()
-    for itemSet in transformMap:
-
-        # 检查 itemSet中是否存在可规约项目
-        # 检查是否存在规约冲突
-        stateToAction[indexedSet.getIdx(itemSet)] = dict()
-        for item in itemSet.items:
-            if not item.nextToken():
-                # 增加规约结果
-                for token in itemSet.items[item]:
-                    if token in stateToAction[indexedSet.getIdx(itemSet)]:
-                        raise Exception("文法存在规则冲突")
-
-                    # 接受状态
-                    if item == Item(SingleRule(rules[beginning].parent, child),1) and token == END:
-                        stateToAction[indexedSet.getIdx(itemSet)][token] = Action(ActionKind.Accept, -1, None) 
-                        continue
-                       
-                    stateToAction[indexedSet.getIdx(itemSet)][token] = Action(ActionKind.Reduce, -1, item.rule)
-        
-        for token in transformMap[itemSet]:
-            if transformMap[itemSet][token] is None:
+            core = tuple(sorted(kernel))
+            target = None
+            for candidate in coreToStates.get(core, ()):
+                expected = kernels[candidate]
+                if all(kernel[item] & ~expected[item] == 0 for item in core):
+                    # 已被包含, 直接复用
+                    target = candidate
+                    stats['reused'] += 1
+                    break
+                if isWeaklyCompatible(core, expected, kernel):
+                    # 合并展望符, 状态需要重新计算后继
+                    for item in core:
+                        expected[item] |= kernel[item]
+                    target = candidate
+                    stats['merged'] += 1
+                    if candidate not in queued:
+                        queued.add(candidate)
+                        stateQueue.append(candidate)
+                    break
+
+            if target is None:
+                target = len(kernels)
+                kernels.append(kernel)
+                transitions.append(dict())
+                coreToStates.setdefault(core, []).append(target)
+                stats['created'] += 1
+                queued.add(target)
+                stateQueue.append(target)
+
+            row[token] = target
+        transitions[state] = row
+
+    # 合并后部分状态可能不再可达, 按广度优先重新编号
+    renumber = {0: 0}
+    order = [0]
+    for state in order:
+        for target in transitions[state].values():
+            if target not in renumber:
+                renumber[target] = len(order)
+                order.append(target)
+
+    states = [ItemSet(grammar, closure(grammar, restFirst, templates, kernels[state])) for state in order]
+    transitions = [{token: renumber[target] for token, target in transitions[state].items()} for state in order]
+    return states, transitions, stats
+
+
+# 生成状态idx的ACTION/GOTO行, 冲突追加到conflicts中
+# 移进-规约冲突按移进处理, 规约-规约冲突保留编号较小的产生式
+def constructActionRow(grammar:Grammar, idx:int, itemSet:ItemSet, transitions:dict[Token, int], conflicts:list[Conflict]):
+    row:dict[Token, Action] = dict()
+
+    # 检查 itemSet中是否存在可规约项目
+    # 检查是否存在规约冲突
+    for item in sorted(itemSet.items):
+        if grammar.itemNext[item] is not None:
+            continue
+
+        rule = grammar.productions[grammar.itemProd[item]]
+        for token in VT_INDEX.iterMask(itemSet.items[item]):
+            if token in row:
+                conflicts.append(Conflict(ConflictKind.ReduceReduce, idx, token, [row[token].rule, rule]))
                 continue
 
-            if isinstance(token, VN):
-                stateToAction[indexedSet.getIdx(itemSet)][token] = \
-                    Action(ActionKind.Goto, indexedSet.getIdx(transformMap[itemSet][token]))
+            # 接受状态
+            if item == grammar.acceptItem and token is END:
+                row[token] = Action(ActionKind.Accept, -1, None)
             else:
-                stateToAction[indexedSet.getIdx(itemSet)][token] = \
-                    Action(ActionKind.Shift, indexedSet.getIdx(transformMap[itemSet][token]))
-    
-    return LR1_FSA(0, stateToAction)
+                row[token] = Action(ActionKind.Reduce, -1, rule)
+
+    for token, target in transitions.items():
+        if token in row:
+            conflicts.append(Conflict(ConflictKind.ShiftReduce, idx, token, [row[token].rule]))
+
+        row[token] = Action(ActionKind.Goto if isinstance(token, VN) else ActionKind.Shift, target)
+
+    return row
+
+
+# 根据项目集族生成分析表, 返回分析表与冲突列表
+def constructActionTable(grammar:Grammar, states:list[ItemSet], transitions:list[dict[Token, int]]):
+    stateToAction:dict[int, dict[Token, Action]] = dict()
+    conflicts:list[Conflict] = list()
+
+    for idx, itemSet in enumerate(states):
+        stateToAction[idx] = constructActionRow(grammar, idx, itemSet, transitions[idx], conflicts)
 
+    return stateToAction, conflicts
+
+
+# 构建LR(1)自动机
+# mode为LRMode.LALR1时合并核心相同的项目集, 状态数与LR(0)相同, 但可能引入规约-规约冲突
+# mode为LRMode.Pager时在构造过程中合并弱相容的项目集, 不会引入新的冲突, 状态数通常接近LALR(1)
+# 存在规约-规约冲突时抛出ConflictError, allowConflicts为True时仅记录在LR1_FSA.conflicts中
+# 构造统计信息记录在LR1_FSA.stats中, traceMemory为True时额外记录内存峰值(tracemalloc, 会降低构造速度)
+#   峰值为相对构造开始时的内存增量; 调用方已经在跟踪内存时不重置其峰值, 此时结果可能包含构造之前的峰值, 只是上界
+# workers大于1时规范LR(1)项目集族在进程池中并行构造, 结果与串行构造相同; LALR1与Pager方式忽略该参数
+# verbose为True时打印所有项目集并绘制自动机
+def constructLR1(rules:dict[VN, Rule], beginning:VN, tokens:Iterable[Token], verbose:bool = False, mode:LRMode = LRMode.LR1, allowConflicts:bool = False, traceMemory:bool = False, workers:int = 1):
+    startTime = time.perf_counter()
+    startTracing = traceMemory and not tracemalloc.is_tracing()
+    if startTracing:
+        tracemalloc.start()
+    startMemory = tracemalloc.get_traced_memory()[0] if traceMemory else 0
+
+    try:
+        # 项目集定义, 产生式与项目统一编号
+        grammar = Grammar(rules, beginning)
+
+        # 构造First集合
+        First = constructFirstMask(rules)
+        restFirst = constructRestFirst(grammar, First)
+        templates = constructClosureTemplates(grammar, restFirst)
+
+        stats = {'mode': mode.name}
+        if mode == LRMode.LALR1:
+            states, transitions = constructLALRCollection(grammar, restFirst, templates, tokens)
+        elif mode == LRMode.Pager:
+            states, transitions, pagerStats = constructPagerCollection(grammar, restFirst, templates, tokens)
+            stats.update(pagerStats)
+        elif workers > 1:
+            states, transitions, parallelStats = constructCanonicalCollectionParallel(grammar, restFirst, templates, tokens, workers)
+            stats.update(parallelStats, workers=workers)
+        else:
+            states, transitions = constructCanonicalCollection(grammar, restFirst, templates, tokens)
+
+        # 打印结果
+        if verbose:
+            for idx, itemSet in enumerate(states):
+                print('ItemSet %d begin' % idx)
+                print(str(itemSet))
+                print('ItemSet %d end\n' % idx)
+            visLR1(states, transitions)
+
+        # 生成自动机
+        stateToAction, conflicts = constructActionTable(grammar, states, transitions)
+
+        stats['states'] = len(states)
+        stats['buildTime'] = time.perf_counter() - startTime
+        if traceMemory:
+            stats['peakMemory'] = max(tracemalloc.get_traced_memory()[1] - startMemory, 0)
+    finally:
+        if startTracing:
+            tracemalloc.stop()
+
+    if not allowConflicts and any(conflict.kind == ConflictKind.ReduceReduce for conflict in conflicts):
+        raise ConflictError([conflict for conflict in conflicts if conflict.kind == ConflictKind.ReduceReduce])
+
+    fsa = LR1_FSA(0, stateToAction, conflicts)
+    fsa.stats = stats
+    return fsa
+
+
+# 构建按需构造的LR(1)自动机, 不预先构造项目集族
+# 分析过程第一次到达某个状态时才计算其闭包, 后继核心与ACTION/GOTO行, 结果按LRU缓存cacheSize行
+# 状态编号由核心项目确定, 核心项目元组一直保留, 被淘汰的行可以重新计算
+# 第一次构造出某行时记录冲突, 存在规约-规约冲突且allowConflicts为False时在分析过程中抛出ConflictError
+def constructLR1Lazy(rules:dict[VN, Rule], beginning:VN, tokens:Iterable[Token], cacheSize:int = None, allowConflicts:bool = False):
+    grammar = Grammar(rules, beginning)
+    First = constructFirstMask(rules)
+    restFirst = constructRestFirst(grammar, First)
+    templates = constructClosureTemplates(grammar, restFirst)
+    tokenIdx = {token: idx for idx, token in enumerate(tokens)}
+
+    kernels = IndexedSet()
+    kernels.add(ItemSet.kernelKey({grammar.itemStart[0]: END_BIT}))
+    # 已经记录过冲突的状态
+    reported:set[int] = set()
+    fsa = LazyLR1_FSA(0, None, cacheSize)
+
+    def expand(state:int):
+        key = kernels[state]
+        itemSet = ItemSet(grammar, closure(grammar, restFirst, templates, dict(key)), key)
+        transitions = dict()
+        for token, kernel in deriveItemSet(grammar, itemSet, tokenIdx).items():
+            kernelKey = ItemSet.kernelKey(kernel)
+            kernels.add(kernelKey)
+            transitions[token] = kernels.getIdx(kernelKey)
+
+        conflicts:list[Conflict] = list()
+        row = constructActionRow(grammar, state, itemSet, transitions, conflicts)
+        if state not in reported:
+            reported.add(state)
+            fsa.conflicts.extend(conflicts)
+            fsa.stats['states'] = len(kernels)
+        # 有冲突的行不进入缓存, 每次展开都重新抛出
+        if not allowConflicts and any(conflict.kind == ConflictKind.ReduceReduce for conflict in conflicts):
+            raise ConflictError([conflict for conflict in conflicts if conflict.kind == ConflictKind.ReduceReduce])
+        return row
+
+    fsa.expand = expand
+    return fsa
+
+
+# 增量构建规范LR(1)自动机
+# previous为上一次由本函数构建的自动机, 比较两次的文法规则, 只重新计算受影响的部分:
+#   First集只重新计算引用了修改过的非终结符的部分, 沿用上一次的产生式与项目编号
+#   闭包由核心项目的后续First集与nextToken的闭包模板决定, 两者均未受影响的状态沿用闭包与后继核心
+#   沿用的状态在后继状态编号不变时沿用其ACTION/GOTO行
+# previous为None或开始符号不同时完整构建; 结果与constructLR1相同, 状态编号可能不同
+def constructLR1Incremental(rules:dict[VN, Rule], beginning:VN, tokens:Iterable[Token], previous:LR1_FSA = None, allowConflicts:bool = False):
+    startTime = time.perf_counter()
+    tokens = list(tokens)
+    rulesCopy = {vn: frozenset(rules[vn].children) for vn in rules}
+    cache:LR1BuildCache = previous.buildCache if previous is not None else None
+    if cache is not None and cache.beginning is not beginning:
+        cache = None
+
+    grammar = None
+    if cache is not None:
+        grammar = Grammar(rules, beginning, cache.grammar)
+        # 开始产生式改变时项目重新编号, 上一次按项目编号保存的结果都不能沿用
+        if not grammar.reusedNumbering:
+            cache = None
+
+    if cache is None:
+        changed = set(rules)
+        grammar = grammar if grammar is not None else Grammar(rules, beginning)
+        First = constructFirstMask(rules)
+        firstChanged = set(rules)
+        tokensChanged = set(tokens)
+    else:
+        changed = set(vn for vn in rulesCopy.keys() | cache.rules.keys() if rulesCopy.get(vn) != cache.rules.get(vn))
+        First, firstChanged = updateFirstMask(rules, cache.First, changed)
+        tokensChanged = set(tokens).symmetric_difference(cache.tokens)
+
+    # 项目受影响: 新增或删除的产生式的项目, 后续序列的First集有变化, 或nextToken新加入(移出)符号表
+    oldItemCount = cache.grammar.itemCount() if cache is not None else 0
+    restFirst = cache.restFirst + [0] * (grammar.itemCount() - oldItemCount) if cache is not None else [0] * grammar.itemCount()
+    dirtyItems = set()
+    for prod in range(len(grammar.productions)):
+        start = grammar.itemStart[prod]
+        body = grammar.prodBody[prod]
+        live = grammar.prodLive[prod]
+        isNew = start >= oldItemCount
+        if not isNew and live == cache.grammar.prodLive[prod] and not any(token in firstChanged or token in tokensChanged for token in body):
+            continue
+
+        for item in range(start, start + len(body) + 1):
+            mask = getFirstMaskOfSeq(First, grammar.itemRest(item)) if live else 0
+            if isNew or live != cache.grammar.prodLive[prod] or mask != restFirst[item] or grammar.itemNext[item] in tokensChanged:
+                dirtyItems.add(item)
+            restFirst[item] = mask
+
+    # 闭包模板受影响: 包含受影响的项目, 或包含被修改的非终结符的产生式(其产生式集合已变化)
+    templates:dict[VN, list[tuple[int, int]]] = dict()
+    dirtyTemplates = set(changed)
+    for vn in grammar.prodOf:
+        template = cache.templates.get(vn) if cache is not None else None
+        if template is None or vn in changed or any(item in dirtyItems or grammar.prodParent[grammar.itemProd[item]] in changed for item, _ in template):
+            template = constructClosureTemplate(grammar, restFirst, vn)
+            dirtyTemplates.add(vn)
+        templates[vn] = template
+
+    def isClean(key:tuple):
+        for item, _ in key:
+            if item in dirtyItems:
+                return False
+            nextToken = grammar.itemNext[item]
+            if nextToken in dirtyTemplates:
+                return False
+        return True
+
+    # 广度优先构造, 与constructCanonicalCollection相同, 沿用上一次的状态
+    tokenIdx = {token: idx for idx, token in enumerate(tokens)}
+    headKey = ItemSet.kernelKey({grammar.itemStart[0]: END_BIT})
+    indexedSet = IndexedSet()
+    indexedSet.add(headKey)
+    newCache = LR1BuildCache(rulesCopy, beginning, tokens, grammar, First, restFirst, templates)
+    stateToAction:dict[int, dict[Token, Action]] = dict()
+    conflicts:list[Conflict] = list()
+    stats = {'mode': LRMode.LR1.name, 'changed': len(changed), 'firstChanged': len(firstChanged), 'reusedStates': 0, 'reusedRows': 0}
+
+    idx = 0
+    while idx < len(indexedSet):
+        key = indexedSet[idx]
+        entry = cache.states.get(key) if cache is not None else None
+        if entry is not None and isClean(key):
+            itemSet, successors = entry[0], entry[1]
+            stats['reusedStates'] += 1
+        else:
+            entry = None
+            itemSet = ItemSet(grammar, closure(grammar, restFirst, templates, dict(key)), key)
+            successors = [(token, ItemSet.kernelKey(kernel)) for token, kernel in deriveItemSet(grammar, itemSet, tokenIdx).items()]
+
+        transitions = dict()
+        for token, kernelKey in successors:
+            indexedSet.add(kernelKey)
+            transitions[token] = indexedSet.getIdx(kernelKey)
+
+        if entry is not None and entry[2] == transitions:
+            row = entry[3]
+            stateConflicts = [Conflict(conflict.kind, idx, conflict.token, conflict.rules) for conflict in entry[4]]
+            stats['reusedRows'] += 1
+        else:
+            stateConflicts = list()
+            row = constructActionRow(grammar, idx, itemSet, transitions, stateConflicts)
+
+        newCache.states[key] = (itemSet, successors, transitions, row, stateConflicts)
+        stateToAction[idx] = row
+        conflicts.extend(stateConflicts)
+        idx += 1
+
+    stats['states'] = len(indexedSet)
+    stats['buildTime'] = time.perf_counter() - startTime
+
+    if not allowConflicts and any(conflict.kind == ConflictKind.ReduceReduce for conflict in conflicts):
+        raise ConflictError([conflict for conflict in conflicts if conflict.kind == ConflictKind.ReduceReduce])
+
+    fsa = LR1_FSA(0, stateToAction, conflicts)
+    fsa.stats = stats
+    fsa.buildCache = newCache
+    return fsa
+
+
+# 分别以各种方式构造自动机, 返回 {mode: stats}, 用于为文法选择合适的构造方式
+def compareLRModes(rules:dict[VN, Rule], beginning:VN, tokens:Iterable[Token], modes:Iterable[LRMode] = tuple(LRMode), traceMemory:bool = True):
+    results = dict()
+    for mode in modes:
+        fsa = constructLR1(rules, beginning, tokens, mode=mode, allowConflicts=True, traceMemory=traceMemory)
+        results[mode] = dict(fsa.stats, conflicts=len(fsa.conflicts))
+    return results
 
 
+# 文法指纹, 由文法规则, 开始符号, 符号表, 构造方式与缓存格式版本决定, 与规则的插入顺序无关
+def grammarFingerprint(rules:dict[VN, Rule], beginning:VN, tokens:Iterable[Token], mode:LRMode = LRMode.LR1, compress:bool = False):
+    # 符号的表示与缓存文件相同, tag不是字符串时抛出异常, 避免不同的符号得到相同的指纹
+    productions = sorted([dumpSymbol(vn), [dumpSymbol(token) for token in child]] for vn in rules for child in rules[vn].children)
+    data = {
+        'version': FORMAT_VERSION,
+        'mode': mode.name,
+        'compress': compress,
+        'beginning': dumpSymbol(beginning),
+        'tokens': sorted(dumpSymbol(token) for token in tokens),
+        'productions': productions,
+    }
+    return hashlib.sha256(json.dumps(data, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+# 带缓存的构建LR(1)自动机
+# 缓存文件中的文法指纹与当前文法一致时直接映射文件, 否则重新构造并覆盖缓存文件
+# 冲突与分析表一同保存, 命中缓存时与重新构造的结果相同, allowConflicts的含义与constructLR1相同
+def constructLR1Cached(rules:dict[VN, Rule], beginning:VN, tokens:Iterable[Token], cachePath:str, mode:LRMode = LRMode.LR1, compress:bool = False, allowConflicts:bool = False):
+    tokens = list(tokens)
+    fingerprint = grammarFingerprint(rules, beginning, tokens, mode, compress)
+
+    if os.path.exists(cachePath):
+        # 缓存文件损坏或无法读取时视为缓存失效
+        try:
+            table = ParseTable.load(cachePath, fingerprint)
+        except Exception:
+            table = None
+        if table is not None:
+            fsa = LR1_FSA.fromTable(table)
+            if not allowConflicts and any(conflict.kind == ConflictKind.ReduceReduce for conflict in fsa.conflicts):
+                raise ConflictError([conflict for conflict in fsa.conflicts if conflict.kind == ConflictKind.ReduceReduce])
+            return fsa
+
+    fsa = constructLR1(rules, beginning, tokens, mode=mode, allowConflicts=allowConflicts)
+    table = fsa.compile(compress)
+    table.save(cachePath, fingerprint, fsa.stats, fsa.conflicts)
+    return fsa
@@ -1 +1 @@
-__all__ = ['Common', 'LR1']
\ No newline at end of file
+__all__ = ['Common', 'Generator', 'LR1']
\ No newline at end of file
@@ -1,4 +1,5 @@
-from queue import Queue
+from array import array
+from entity.Token import VT
 
 
 class DFA:
@@ -7,20 +8,24 @@ class DFA:
     """
     error = -1
 
-    def __init__(self, stateMap: dict[int, dict[str, int]], acceptedState: set[int], beginningState: int) -> None:
+    def __init__(self, stateMap: dict[int, dict[str, int]], acceptedState: set[int], beginningState: int, tags: dict = None) -> None:
         """__init__ 可以看作一个有向图, 点表示状态, 边表示接收某些输入时, 需要转移状态
             初始状态为0
         Args:
             states (list[int]): 状态序列
             stateMap (dict[int, dict[str, int]]): 状态转移表
             acceptedState (set[int]): 接收状态
+            tags (dict): 接收状态的标记, 如词法分析中接收状态对应的终结符, 最小化时标记不同的状态不会合并
         """
         self.state = 0 if not beginningState else beginningState
+        self.beginningState = self.state
         self.stateMap = stateMap
         if self.state not in self.stateMap:
             raise Exception(
                 "beginningState %d must be in stateMap" % self.state)
         self.acceptedState = acceptedState
+        self.tags = tags if tags is not None else dict()
+        self.table: DFATable = None
 
     def consume(self, c):
         if not c:
@@ -30,102 +35,298 @@ class DFA:
             return
 
         if c not in self.stateMap[self.state]:
-            self.state == DFA.error
+            self.state = DFA.error
+            return
 
         self.state = self.stateMap[self.state][c]
 
     def accept(self) -> bool:
         return self.state in self.acceptedState
 
+    def minimize(self):
+        """minimize Hopcroft算法最小化, 见algorithm.FA.minimizeDFA
+
+        Returns:
+            DFA: 等价的最小DFA, 状态重新编号为 0..m-1
+        """
+        # 延迟导入, algorithm.FA依赖本模块
+        from algorithm.FA import minimizeDFA
+
+        return minimizeDFA(self)
+
+    def compile(self):
+        """compile 编译为数组形式的转移表, 见DFATable
+        """
+        self.table = DFATable.fromDFA(self)
+        return self.table
+
+
+class ClassMap(dict):
+    # str.translate的映射表, 不在表中的字符映射为0号等价类
+    def __missing__(self, key):
+        return 0
+
+
+class DFATable:
+    """ 编译后的DFA, 输入字符先映射为等价类编号, 在所有状态上转移都相同的字符属于同一等价类
+        转移表为 状态 × 等价类 的int32数组, 表项为目标状态的行首位置(状态编号 × 等价类个数), 省去乘法
+        0号状态为死状态, 所有转移都回到自身; 0号等价类为未出现在任何转移上的字符
+        接收状态排在最后, 行首位置 >= acceptBase 即为接收状态
+        扫描时使用由转移表生成的rows: 每行为一个list, 第c个元素为读入等价类c后的行本身, 循环中只有一次下标访问
+        行的第classCount个元素为对应的DFA状态, 第classCount+1个元素表示是否为接收状态
+        bytes输入的字节b视为字符chr(b)
+    """
+    def __init__(self, classOf: dict[str, int], classCount: int, transitions: array, start: int, acceptBase: int, states: list[int]) -> None:
+        self.classOf = classOf
+        self.classCount = classCount
+        self.transitions = transitions
+        self.start = start
+        self.acceptBase = acceptBase
+        # states[i]为第i行对应的DFA状态
+        self.states = states
+
+        # 字符的映射表覆盖latin-1的全部字符, 只有输入中出现其余的未知字符时才需要ClassMap
+        self.charTable = {code: 0 for code in range(0x100)}
+        self.charTable.update((ord(c), classIdx) for c, classIdx in classOf.items())
+        self.byteTable = bytes(self.charTable[code] for code in range(0x100)) if classCount <= 0x100 else None
+        self.rows = self.linkRows()
+
+    def linkRows(self) -> list[list]:
+        classCount = self.classCount
+        rows = [[None] * classCount + [state, idx * classCount >= self.acceptBase] for idx, state in enumerate(self.states)]
+        for idx, row in enumerate(rows):
+            base = idx * classCount
+            for classIdx in range(classCount):
+                row[classIdx] = rows[self.transitions[base + classIdx] // classCount]
+        return rows
+
+    def __getstate__(self):
+        # rows中有环且可以由转移表生成, 不序列化
+        state = dict(self.__dict__)
+        del state['rows']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.rows = self.linkRows()
+
+    @staticmethod
+    def fromDFA(dfa: DFA):
+        stateMap = dfa.stateMap
+        rejected = [state for state in stateMap if state not in dfa.acceptedState]
+        accepted = [state for state in stateMap if state in dfa.acceptedState]
+        states = [DFA.error] + rejected + accepted
+        rowOf = {state: idx for idx, state in enumerate(states)}
+
+        # 按各状态上的转移目标对字符分组
+        chars = sorted(set(c for row in stateMap.values() for c in row))
+        for c in chars:
+            if len(c) != 1:
+                raise Exception("Symbol %r is not a single character" % c)
+        classOf: dict[str, int] = dict()
+        columns: dict[tuple, int] = dict()
+        for c in chars:
+            column = tuple(rowOf[row[c]] if c in row else 0 for row in (stateMap[state] for state in states[1:]))
+            classOf[c] = columns.setdefault(column, len(columns) + 1)
+
+        classCount = len(columns) + 1
+        transitions = array('i', bytes(4 * classCount * len(states)))
+        for column, classIdx in columns.items():
+            for row, target in enumerate(column, 1):
+                transitions[row * classCount + classIdx] = target * classCount
+
+        return DFATable(classOf, classCount, transitions, rowOf[dfa.beginningState] * classCount, (len(rejected) + 1) * classCount, states)
+
+    def classify(self, buffer):
+        """classify 将输入映射为等价类编号的序列, 由translate在C中完成
+
+        Args:
+            buffer: str, bytes, bytearray 或 memoryview
+
+        Returns:
+            memoryview: 第i个元素为第i个字符的等价类编号
+        """
+        if isinstance(buffer, str):
+            if self.classCount > 0x100:
+                return memoryview(buffer.translate(ClassMap(self.charTable)).encode('utf-32-le')).cast('I')
+            try:
+                return memoryview(buffer.translate(self.charTable).encode('latin-1'))
+            except UnicodeEncodeError:
+                return memoryview(buffer.translate(ClassMap(self.charTable)).encode('latin-1'))
+
+        if not isinstance(buffer, (bytes, bytearray)):
+            buffer = bytes(buffer)
+        if self.byteTable is not None:
+            return memoryview(buffer.translate(self.byteTable))
+        return memoryview(array('I', (self.charTable[b] for b in buffer)))
+
+    def finalRow(self, buffer) -> list:
+        # 读入整个输入后所在的行, 死状态吸收后续输入, 循环中无需判断
+        row = self.rows[self.start // self.classCount]
+        for classIdx in self.classify(buffer):
+            row = row[classIdx]
+        return row
+
+    def run(self, buffer) -> int:
+        """run 读入整个输入
+
+        Returns:
+            int: 最终的DFA状态, 中途无法转移时为DFA.error
+        """
+        return self.finalRow(buffer)[self.classCount]
+
+    def accepts(self, buffer) -> bool:
+        return self.finalRow(buffer)[self.classCount + 1]
+
+    def match(self, classes: memoryview, start: int = 0) -> tuple[int, int]:
+        """match 从start开始的最长匹配, 遇到死状态即停止
+
+        Args:
+            classes (memoryview): classify的结果, 多次匹配同一输入时只需映射一次
+            start (int): 开始位置
+
+        Returns:
+            tuple[int, int]: (匹配的结束位置, 结束时的DFA状态), 没有匹配时为 (-1, DFA.error)
+        """
+        rows, flag = self.rows, self.classCount + 1
+        dead = rows[0]
+        row = rows[self.start // self.classCount]
+        end, accepted = (start, row) if row[flag] else (-1, dead)
+
+        for position, classIdx in enumerate(classes[start:], start + 1):
+            row = row[classIdx]
+            if row[flag]:
+                end, accepted = position, row
+            elif row is dead:
+                break
+        return end, accepted[flag - 1]
+
+    def scan(self, buffer, start: int = 0) -> tuple[int, int]:
+        """scan 在buffer上从start开始做最长匹配, 见match
+        """
+        return self.match(self.classify(buffer), start)
+
 
 class NFA:
     """非确定有限状态自动机 允许空边的存在
-        空串''表示空边
+        Thompson构造的形式, 状态为0..n-1, 每个状态至多两条出边, 转移保存在按状态编号的数组中
+        symbol[s]为''时, out1[s], out2[s]为s的两条空边的目标, -1表示不存在
+        否则s接收symbol[s]后转移到out1[s]
     """
 
-    def __init__(self, stateMap: dict[int, dict[str, int]], acceptedState: set[int], beginningState: int, chars: set[str]) -> None:
+    def __init__(self, symbol: list[str] = None, out1: array = None, out2: array = None, acceptedState: set[int] = None, beginningState: int = 0, chars: set[str] = None) -> None:
         """__init__ 可以看作一个有向图, 点表示状态, 边表示接收某些输入时, 需要转移状态
-            初始状态为0
         Args:
-            states (list[int]): 状态序列
-            stateMap (dict[int, dict[str, int]]): 状态转移表
+            symbol (list[str]): 每个状态出边上的符号, 空串''表示空边
+            out1 (array): 每个状态的第一条出边的目标
+            out2 (array): 每个状态的第二条出边(只能是空边)的目标
             acceptedState (set[int]): 接收状态
+            beginningState (int): 初始状态
             chars (set[str]): 符号集
         """
-        self.state = 0 if not beginningState else beginningState
-        self.stateMap = stateMap
-        if self.state not in self.stateMap:
-            raise Exception(
-                "beginningState %d must be in stateMap" % self.state)
-        self.acceptedState = acceptedState
+        self.symbol = symbol if symbol is not None else list()
+        self.out1 = out1 if out1 is not None else array('i')
+        self.out2 = out2 if out2 is not None else array('i')
+        self.acceptedState = acceptedState if acceptedState is not None else set()
         self.beginningState = beginningState
-        self.chars = chars
+        self.chars = chars if chars is not None else set()
+
+    def addState(self, symbol: str = '', out1: int = -1, out2: int = -1) -> int:
+        self.symbol.append(symbol)
+        self.out1.append(out1)
+        self.out2.append(out2)
+        if symbol:
+            self.chars.add(symbol)
+        return len(self.symbol) - 1
+
+    def stateCount(self) -> int:
+        return len(self.symbol)
 
     def closure(self, originStates: set[int]):
-        """closure 计算状态闭包
+        """closure 计算状态闭包, 每个状态只访问一次
 
         Args:
             originStates (set[int]): 当前状态
         """
-        updated = True
-        tmpSet = set()
         resultSet = set(originStates)
-
-        while updated:
-            updated = False
-            for state in resultSet:
-                if state in self.stateMap and self.stateMap[state].get('', default=-1) >= 0:
-                    if self.stateMap[state] not in resultSet:
-                        tmpSet.add(self.stateMap[state])
-                        updated = True
-            resultSet.update(tmpSet)
-            tmpSet.clear()
+        worklist = list(resultSet)
+        while worklist:
+            state = worklist.pop()
+            if self.symbol[state]:
+                continue
+            for target in (self.out1[state], self.out2[state]):
+                if target >= 0 and target not in resultSet:
+                    resultSet.add(target)
+                    worklist.append(target)
         return frozenset(resultSet)
 
+    def match(self, text: str) -> bool:
+        """match 直接模拟NFA, 判断整个text是否被接收
+        """
+        states = self.closure({self.beginningState})
+        for c in text:
+            states = self.closure(set(self.out1[s] for s in states if self.symbol[s] == c))
+            if not states:
+                return False
+        return not states.isdisjoint(self.acceptedState)
+
     def toDFA(self) -> DFA:
-        """toDFA 子集法根据NFA构造DFA
+        """toDFA 子集法根据NFA构造DFA, 见algorithm.FA.subsetConstruction
 
         Returns:
             DFA: 确定有限状态自动机
         """
+        # 延迟导入, algorithm.FA依赖本模块
+        from algorithm.FA import subsetConstruction
 
-        headStates = self.closure(set((self.beginningState,)))
-        q: Queue[frozenset] = Queue
-        q.put(headStates)
-
-        stateMap: dict[int, dict[str, int]] = dict()
-        statesToIdx: dict[frozenset, int] = dict()
-        statesIdx: int = 1
-
-        statesToIdx[headStates] = 0
+        stateMap, states = subsetConstruction(self)
+        # 包含NFA接收状态的状态集为DFA的接收状态
+        acceptedState = set(idx for idx, nfaStates in enumerate(states) if not self.acceptedState.isdisjoint(nfaStates))
+        return DFA(stateMap, acceptedState, 0)
 
-        while not q.empty():
-            states = q.get()
-            for c in self.chars:
-                nextStates = set()
-                for s in states:
-                    if s in self.stateMap and self.stateMap[s].get(c, default=-1) >= 0:
-                        nextStates.add(self.stateMap[s].get(c))
-                
-                if not nextStates:
-                    continue
 
-                nextStates = self.closure(nextStates)
+class MNFA(NFA):
+    """ 多个模式的NFA, 用于词法分析
+        各模式生成到同一个NFA中, 初始状态经空边到达每个模式的开始, 每个模式有各自的接收状态
+        接收状态标记为模式对应的终结符, 先加入的模式优先级高, 同一个输入被多个模式接收时取优先级最高的
+    """
 
-                if nextStates not in statesToIdx:
-                    statesToIdx[nextStates] = statesIdx
-                    statesIdx += 1
-                    q.put(nextStates)
+    def __init__(self) -> None:
+        super().__init__(beginningState=-1)
+        # 接收状态 -> 终结符, 为None时表示匹配的内容被跳过, 如空白与注释
+        self.tags: dict[int, VT] = dict()
+        # 接收状态 -> 优先级, 越小越优先
+        self.priority: dict[int, int] = dict()
 
-                stateMap[statesToIdx[states]][c] = statesToIdx[nextStates]
+    def addPattern(self, pattern: str, tag: VT):
+        """addPattern 加入一个模式, 语法见algorithm.FA.RegExpParser
 
-        acceptedState = self.closure(self.acceptedState)
-        return DFA(stateMap, acceptedState, 0)
+        Args:
+            pattern (str): 正则表达式, 不能匹配空串
+            tag (VT): 模式对应的终结符, 为None时匹配的内容被跳过
+        """
+        # 延迟导入, algorithm.FA依赖本模块
+        from algorithm.FA import RegExpParser
 
+        start, end = RegExpParser(pattern, self).parse()
+        # 可以匹配空串的模式在词法分析时不前进
+        if end in self.closure({start}):
+            raise Exception('模式 %s 可以匹配空串' % pattern)
+        # 新的初始状态经空边到达原初始状态与本模式的开始
+        self.beginningState = start if self.beginningState < 0 else self.addState('', self.beginningState, start)
+        self.acceptedState.add(end)
+        self.tags[end] = tag
+        self.priority[end] = len(self.priority)
 
-class MNFA:
-    """ 允许多个目标的NFA
-    """
+    def toDFA(self) -> DFA:
+        """toDFA 子集法构造DFA, 接收状态标记为其包含的优先级最高的模式的终结符
+        """
+        from algorithm.FA import subsetConstruction
 
-    def __init__(self) -> None:
-        pass
+        stateMap, states = subsetConstruction(self)
+        tags = dict()
+        for idx, nfaStates in enumerate(states):
+            accepted = [state for state in nfaStates if state in self.priority]
+            if accepted:
+                tags[idx] = self.tags[min(accepted, key=self.priority.__getitem__)]
+        return DFA(stateMap, set(tags), 0, tags)
@@ -1,5 +1,3 @@
-import graphviz
-
 class IndexedSet:
     def __init__(self) -> None:
         self.data_dict = dict()
@@ -84,6 +82,9 @@ class DirectedGraph:
         self.graph[edge.head][edge.tail].add(edge)
 
     def visualize(self):
+        # 仅在绘图时依赖graphviz
+        import graphviz
+
         e = graphviz.Digraph('ER', filename='er.gv', engine='dot',graph_attr={'size':'100,50'})
         # e.attr(rankdir='LR')
         e.attr('node', shape='box')
@@ -1,93 +1,46 @@
 from typing import Iterable
-from entity.Token import Token,VN,VT, EPSILON, END
-from entity.Rule import SingleRule,Rule
+from entity.Token import Token,VN, EPSILON, END, VT_INDEX
+from entity.Rule import SingleRule,Grammar
+from entity.Table import ParseTable, ACCEPT
+from entity.Tree import CompactTree
 from enum import Enum
-
-class Item:
-    # 项目, 某个规则的前pos个条件已经满足
-    # 每一个项目由项目id, 和项目位置唯一标定
-    def __init__(self, rule:SingleRule, pos:int) -> None:
-        self.rule = rule
-        self.pos = pos
-
-        # 空推导式直接进入规约状态
-        if self.pos<len(self.rule.child) and self.rule.child[self.pos] == EPSILON:
-            self.pos = 1
-
-    def nextToken(self):
-        if self.pos >= len(self.rule.child):
-            return None
-        return self.rule.child[self.pos]
-
-    def restToken(self):
-        return self.rule.child[self.pos+1:]
-
-    def __hash__(self) -> int:
-        return hash(self.rule) ^ hash(self.pos)
-
-    def __eq__(self, o: object) -> bool:
-        if o is None:
-            return False
-        if isinstance(o, self.__class__):
-            return self.rule == o.rule and self.pos == o.pos
-        return False
-
-
-class ItemExtends:
-    # 项目, 某个规则的前pos个条件已经满足
-    # 每一个项目由项目id, 和项目位置, 和展望符唯一标定
-    def __init__(self, rule:SingleRule, pos:int, expectedVT:Iterable[VT]) -> None:
-        self.projectItem = Item(rule, pos)
-
-        # 展望符
-        self.expectedVT = frozenset( vt for vt in expectedVT)
-
-    def nextToken(self):
-        return self.projectItem.nextToken()
-
-    def __hash__(self) -> int:
-        return hash(self.projectItem) ^ hash(self.expectedVT)
-
-    def __eq__(self, o: object) -> bool:
-        if o is None:
-            return False
-        if isinstance(o, self.__class__):
-            return self.projectItem == o.projectItem and self.expectedVT == o.expectedVT
-        return False
-
+from array import array
+from collections import OrderedDict
+import multiprocessing
+import os
 
 class ItemSet:
     # 项目集
-    # 数据结构为 {ProjectItem: ExpectedVT}
+    # 项目为Grammar中的项目编号, 数据结构为 {item: ExpectedVT}, 展望符为终结符位掩码
+    # 闭包由核心项目唯一确定, 哈希与比较只基于核心项目按编号排序的元组 key
     # 一经构建，不允许修改
-    def __init__(self, items:Iterable[ItemExtends]) -> None:        
-        self.items: dict[Item, frozenset[VT]] = dict()
-        for item in items:
-            if item.projectItem not in self.items:
-                self.items[item.projectItem] = frozenset(item.expectedVT)
-            else:
-                self.items[item.projectItem] = frozenset( item.expectedVT | self.items[item.projectItem])
-
+    def __init__(self, grammar:Grammar, items:dict[int, int], key:tuple = None) -> None:        
+        self.grammar = grammar
+        self.items: dict[int, int] = items
+        if key is None:
+            # 核心项目: 点不在最左边的项目, 以及开始项目
+            key = ItemSet.kernelKey({item: mask for item, mask in items.items() if grammar.itemDot[item] or item == grammar.itemStart[0]})
+        self.key = key
+        self.hash = hash(self.key)
+
+    @staticmethod
+    def kernelKey(kernel:dict[int, int]) -> tuple:
+        return tuple(sorted(kernel.items()))
 
     def __hash__(self) -> int:
-        v = 0
-        for item in self.items:
-            v ^= (hash(item) ^ hash(self.items[item])) 
-        return v
+        return self.hash
 
     def __eq__(self, o: object) -> bool:
         if o is None:
             return False
         if isinstance(o, self.__class__):
-            return self.items == o.items
+            return self.key == o.key
         return False
 
     def __str__(self) -> str:
         itemStr = []
         for item in self.items:
-            childStr = list(c.tag for c in item.rule.child)
-            childStr.insert(item.pos, '~')
-            itemStr.append('%s -> %s, (%s)' % (item.rule.parent.tag, ' '.join(childStr), ','.join(token.tag for token in self.items[item]))) 
+            itemStr.append('%s, (%s)' % (self.grammar.itemStr(item), ','.join(token.tag for token in VT_INDEX.iterMask(self.items[item])))) 
         return '\n'.join(itemStr)
 
 class ActionKind(Enum):
@@ -102,56 +55,436 @@ class Action:
         self.state = state
         self.rule = rule
 
+class LRMode(Enum):
+    # 自动机构造方式
+    LR1 = 0
+    LALR1 = 1
+    # Pager弱相容合并, 构造过程中合并状态, 不引入新的冲突
+    Pager = 2
+
+class ConflictKind(Enum):
+    ShiftReduce = 0
+    ReduceReduce = 1
+
+class Conflict:
+    # 分析表冲突, 记录冲突所在状态, 展望符以及涉及的产生式
+    def __init__(self, kind:ConflictKind, state:int, token:Token, rules:list[SingleRule]) -> None:
+        self.kind = kind
+        self.state = state
+        self.token = token
+        self.rules = rules
+
+    def __str__(self) -> str:
+        return '%s conflict in state %d on %s: %s' % (self.kind.name, self.state, self.token.tag, '; '.join(str(rule) for rule in self.rules))
+
+class ConflictError(Exception):
+    def __init__(self, conflicts:list[Conflict]) -> None:
+        super().__init__('文法存在规则冲突\n' + '\n'.join(str(conflict) for conflict in conflicts))
+        self.conflicts = conflicts
+
+class LR1BuildCache:
+    """ 增量构建(algorithm.LR1.constructLR1Incremental)保留的中间结果
+        rules为 {非终结符: 产生式体集合}, 用于与下一次的文法比较
+        states为 {核心项目元组: (项目集, [(符号, 后继核心)], {符号: 后继状态}, ACTION/GOTO行, 冲突)}
+    """
+    def __init__(self, rules:dict[VN, frozenset], beginning:VN, tokens:list[Token], grammar:Grammar, First:dict[VN, int], restFirst:list[int], templates:dict) -> None:
+        self.rules = rules
+        self.beginning = beginning
+        self.tokens = tokens
+        self.grammar = grammar
+        self.First = First
+        self.restFirst = restFirst
+        self.templates = templates
+        self.states:dict[tuple, tuple] = dict()
+
 class AST:
+    # 语法树节点, 由规约产生, children中的叶子节点为输入的终结符
+    __slots__ = ('rule', 'parent', 'children')
+
     def __init__(self, parent, rule = None, children = None) -> None:
         self.rule:SingleRule = rule
         self.parent:Token = parent
         self.children:Iterable[AST] = children
 
+# 未注册语义动作的产生式, 与yacc相同取第一个子节点的值
+def defaultAction(*values):
+    return values[0] if values else None
+
+
+class PushParser:
+    """ 推送式分析器, 逐个接收终结符, 只保存分析栈, 不保存输入序列
+        状态栈预先分配, top为栈顶下标, 出栈只需移动top, 栈满时容量翻倍
+        移进时直接压入终结符(或与之对应的值), 只在规约时创建AST节点
+        给出语义动作时, 规约调用 action(*子节点的值), 压入返回值而不是AST节点, 内存只与栈深度有关
+        compact为True时构建列式存储的CompactTree, 输入栈中为节点下标, 语义动作不生效
+    """
+    def __init__(self, table:ParseTable, actions:dict[SingleRule, object] = None, compact:bool = False) -> None:
+        self.table = table
+        self.compact = compact
+        # 每个产生式的语义动作, 为None时构建AST
+        self.reducers:list = None
+        self.setActions(actions)
+        self.reset()
+
+    def setActions(self, actions:dict[SingleRule, object]):
+        # 分析过程中也可以更新, 之后的规约使用新的语义动作
+        self.reducers = None
+        if actions and not self.compact:
+            self.reducers = [actions.get(rule, defaultAction) for rule in self.table.productions]
+
+    def reset(self):
+        self.stateStack = array('i', bytes(4 * 256))
+        self.stateStack[0] = self.table.initState
+        self.top = 0
+        self.inputStack = []
+        # 已接收的终结符个数
+        self.position = 0
+        self.accepted = False
+        self.result = None
+        self.tree:CompactTree = CompactTree.fromTable(self.table) if self.compact else None
+
+    def feed(self, token:Token, value = None):
+        return self.feed_many((token,), None if value is None else (value,))
+
+    def feed_many(self, tokens:Iterable[Token], values:Iterable = None):
+        """feed_many 依次接收终结符, 可以是生成器等任意可迭代对象
+
+        Args:
+            tokens (Iterable[Token]): 终结符序列
+            values (Iterable): 与终结符一一对应的值(如词素), 移进时代替终结符压入输入栈
+
+        Returns:
+            接收END后分析完成, 返回语法树的根节点(或语义动作的结果), 否则返回None
+        """
+        if self.accepted:
+            raise Exception('分析已结束, 需要先调用reset')
+
+        table = self.table
+        terminalIdx = table.terminalIdx
+        actionBase, actionTable, actionCheck, actionDefault = table.actionBase, table.actionTable, table.actionCheck, table.actionDefault
+        gotoBase, gotoTable = table.gotoBase, table.gotoTable
+        prodParent, prodLen, productions = table.prodParent, table.prodLen, table.productions
+
+        stateStack, inputStack, reducers, tree = self.stateStack, self.inputStack, self.reducers, self.tree
+        top, position = self.top, self.position
+        state = stateStack[top]
+        valueIter = None if values is None else iter(values)
+
+        try:
+            for token in tokens:
+                column = terminalIdx.get(token, -1)
+                if column < 0:
+                    raise Exception('语法错误: 位置 %d, 未知符号 %s' % (position, str(token)))
+
+                while True:
+                    pos = actionBase[state] + column
+                    if actionCheck is None or actionCheck[pos] == state:
+                        value = actionTable[pos]
+                    else:
+                        value = actionDefault[state]
+
+                    if value > 0:
+                        # 移进
+                        state = value - 1
+                        top += 1
+                        if top == len(stateStack):
+                            stateStack.extend(stateStack)
+                        stateStack[top] = state
+                        if tree is not None:
+                            inputStack.append(tree.addLeaf(column, position))
+                        else:
+                            inputStack.append(token if valueIter is None else next(valueIter))
+                        break
+
+                    elif value < ACCEPT:
+                        # 规约, 状态栈与输入栈原地出栈
+                        prod = -value - 2
+                        length = prodLen[prod]
+                        if tree is not None:
+                            if length:
+                                node = tree.addNode(prod, inputStack[-length:], position)
+                                del inputStack[-length:]
+                            else:
+                                node = tree.addNode(prod, (), position)
+                        elif reducers is not None:
+                            if length:
+                                node = reducers[prod](*inputStack[-length:])
+                                del inputStack[-length:]
+                            else:
+                                node = reducers[prod]()
+                        else:
+                            rule = productions[prod]
+                            if length:
+                                node = AST(rule.parent, rule, inputStack[-length:])
+                                del inputStack[-length:]
+                            else:
+                                node = AST(rule.parent, rule, [])
+                        inputStack.append(node)
+
+                        top -= length
+                        state = gotoTable[gotoBase[stateStack[top]] + prodParent[prod]]
+                        top += 1
+                        if top == len(stateStack):
+                            stateStack.extend(stateStack)
+                        stateStack[top] = state
+
+                    elif value == ACCEPT:
+                        #接收状态直接返回
+                        assert len(inputStack) == 1
+                        position += 1
+                        self.accepted = True
+                        self.result = inputStack.pop()
+                        if tree is not None:
+                            tree.root = self.result
+                            self.result = tree
+                        return self.result
+
+                    else:
+                        raise Exception('语法错误: 位置 %d, 符号 %s' % (position, str(token)))
+
+                position += 1
+        finally:
+            self.top, self.position = top, position
+
+        return None
+
+    def finish(self):
+        """finish 输入结束, 接收END并返回语法树的根节点
+        """
+        if not self.accepted:
+            self.feed(END)
+        return self.result
+
+
+# parse_many的工作进程中使用的分析器, 每个进程只创建一次
+# fork方式下在创建进程池之前赋值, 子进程直接继承父进程的内存, 分析表不经过序列化
+workerParser:PushParser = None
+
+def initWorker(table:ParseTable, actions:dict, compact:bool):
+    global workerParser
+    workerParser = PushParser(table, actions, compact)
+
+def parseInWorker(tokenStream):
+    parser = workerParser
+    parser.reset()
+    result = parser.feed_many(tokenStream)
+    if result is None:
+        raise Exception('语法错误: 输入未以END结束')
+    return result
+
+
 class LR1_FSA:
-    def __init__(self, initState:int, stateToAction:dict) -> None:
+    def __init__(self, initState:int, stateToAction:dict, conflicts:list[Conflict] = None) -> None:
         self.initState = initState
         self.stateToAction:dict[int, dict[Token, Action]] = stateToAction
-
-    def analyse(self, tokenStream:list[Token]):
-        # 状态栈, 输出栈, 输入栈
+        # 构造时发现的冲突, 移进-规约冲突按移进处理
+        self.conflicts:list[Conflict] = conflicts if conflicts else []
+        # 构造统计信息, 如状态数, 合并次数, 耗时, 内存峰值
+        self.stats:dict = dict()
+        # 编译后的分析表, 分析时使用
+        self.table:ParseTable = None
+        # feed/feed_many/finish使用的推送式分析器
+        self.activeParser:PushParser = None
+        # 产生式的语义动作
+        self.actions:dict[SingleRule, object] = dict()
+        # 增量构建保留的中间结果
+        self.buildCache:LR1BuildCache = None
+
+    @staticmethod
+    def fromTable(table:ParseTable):
+        """fromTable 由编译后的分析表(如从缓存文件加载的表)构造自动机
+            stateToAction在第一次访问时才从分析表还原
+        """
+        fsa = LR1_FSA(table.initState, None, list(table.conflicts))
+        fsa.table = table
+        fsa.stats = dict(table.stats)
+        return fsa
+
+    @property
+    def stateToAction(self) -> dict:
+        if self._stateToAction is None and self.table is not None:
+            self._stateToAction = self.table.toStateToAction()
+        return self._stateToAction
+
+    @stateToAction.setter
+    def stateToAction(self, stateToAction:dict):
+        self._stateToAction = stateToAction
+
+    def compile(self, compress:bool = False) -> ParseTable:
+        """compile 将stateToAction编译为int32数组形式的分析表
+
+        Args:
+            compress (bool): 是否使用行位移压缩, 压缩后每行出现最多的规约作为默认动作
+        """
+        self.table = ParseTable.fromStateToAction(self.initState, self.stateToAction, compress)
+        return self.table
+
+    def setAction(self, rule:SingleRule, action):
+        """setAction 注册产生式的语义动作
+            规约时调用 action(*子节点的值), 返回值作为左部的值; 终结符的值为终结符本身或feed时给出的值
+            注册了任意语义动作后, 分析结果为开始产生式的值, 不再构建AST, 未注册的产生式取第一个子节点的值
+
+        Args:
+            rule (SingleRule): 产生式, 如 SingleRule(E, (E, PLUS, T))
+            action: 语义动作, 为None时取消注册
+        """
+        if action is None:
+            self.actions.pop(rule, None)
+        else:
+            self.actions[rule] = action
+        # 正在进行的推送式分析之后的规约同样使用新的语义动作
+        if self.activeParser is not None:
+            self.activeParser.setActions(self.actions)
+
+    def parser(self, compact:bool = False) -> PushParser:
+        """parser 创建一个独立的推送式分析器, 多个分析器可以同时使用同一个自动机
+
+        Args:
+            compact (bool): 是否构建列式存储的CompactTree代替AST
+        """
+        return PushParser(self.table if self.table is not None else self.compile(), self.actions, compact)
+
+    def reset(self):
+        # 放弃正在进行的推送式分析
+        self.activeParser = None
+
+    def feed(self, token:Token, value = None):
+        # 上一次分析已经接受(如feed了END)时开始新的分析
+        if self.activeParser is None or self.activeParser.accepted:
+            self.activeParser = self.parser()
+        return self.activeParser.feed(token, value)
+
+    def feed_many(self, tokens:Iterable[Token], values:Iterable = None):
+        if self.activeParser is None or self.activeParser.accepted:
+            self.activeParser = self.parser()
+        return self.activeParser.feed_many(tokens, values)
+
+    def finish(self):
+        """finish 结束当前的推送式分析, 返回语法树的根节点, 之后的feed开始新的分析
+        """
+        if self.activeParser is None:
+            self.activeParser = self.parser()
+        parser, self.activeParser = self.activeParser, None
+        return parser.finish()
+
+    def analyse(self, tokenStream:Iterable[Token], values:Iterable = None, compact:bool = False):
+        # 输入序列以END结束, 分析过程只进行数组下标运算
+        result = self.parser(compact).feed_many(tokenStream, values)
+        if result is None:
+            raise Exception('语法错误: 输入未以END结束')
+        return result
+
+    def parse_many(self, streams:Iterable[Iterable[Token]], workers:int = None, compact:bool = False, chunksize:int = 16):
+        """parse_many 在进程池中分析多个相互独立的终结符序列, 按输入顺序依次返回结果
+            分析表只传给每个工作进程一次: 支持fork时子进程直接继承, 否则在进程初始化时传入
+            任务只传递终结符序列, 结果(AST, CompactTree或语义动作的值)需要可以序列化
+            语义动作在非fork方式下同样需要可以序列化, 如模块级函数
+
+        Args:
+            streams: 终结符序列的序列, 每个序列以END结束, 可以是生成器
+            workers (int): 进程数, 默认为CPU核数, 不大于1时在当前进程中依次分析
+            compact (bool): 是否构建CompactTree
+            chunksize (int): 每次分派给工作进程的序列个数
+
+        Returns:
+            按输入顺序返回分析结果的生成器, 出现语法错误时在取到对应结果时抛出异常
+        """
+        global workerParser
+        table = self.table if self.table is not None else self.compile()
+        if workers is None:
+            workers = os.cpu_count() or 1
+
+        if workers <= 1:
+            parser = PushParser(table, self.actions, compact)
+            for tokenStream in streams:
+                parser.reset()
+                result = parser.feed_many(tokenStream)
+                if result is None:
+                    raise Exception('语法错误: 输入未以END结束')
+                yield result
+            return
+
+        if 'fork' in multiprocessing.get_all_start_methods():
+            workerParser = PushParser(table, self.actions, compact)
+            pool = multiprocessing.get_context('fork').Pool(workers)
+            workerParser = None
+        else:
+            pool = multiprocessing.Pool(workers, initWorker, (table, self.actions, compact))
+
+        with pool:
+            yield from pool.imap(parseInWorker, streams, chunksize)
+
+
+class LazyLR1_FSA:
+    """ 按需构造的LR(1)自动机, 由algorithm.LR1.constructLR1Lazy创建
+        expand(state)计算状态的ACTION/GOTO行 {token: Action}, 只在分析过程第一次到达该状态时调用
+        已计算的行按LRU缓存, cacheSize为None时不淘汰
+    """
+    def __init__(self, initState:int, expand, cacheSize:int = None) -> None:
+        self.initState = initState
+        self.expand = expand
+        self.cacheSize = cacheSize
+        self.rows:OrderedDict[int, dict[Token, Action]] = OrderedDict()
+        self.conflicts:list[Conflict] = list()
+        # expanded: 计算行的次数, hits: 命中缓存的次数, evicted: 淘汰的行数, states: 已发现的状态数
+        self.stats:dict = {'expanded': 0, 'hits': 0, 'evicted': 0, 'states': 1}
+        self.actions:dict[SingleRule, object] = dict()
+
+    def row(self, state:int) -> dict[Token, Action]:
+        row = self.rows.get(state)
+        if row is not None:
+            self.stats['hits'] += 1
+            if self.cacheSize is not None:
+                self.rows.move_to_end(state)
+            return row
+
+        row = self.expand(state)
+        self.stats['expanded'] += 1
+        self.rows[state] = row
+        if self.cacheSize is not None and len(self.rows) > self.cacheSize:
+            self.rows.popitem(last=False)
+            self.stats['evicted'] += 1
+        return row
+
+    def setAction(self, rule:SingleRule, action):
+        # 与LR1_FSA.setAction相同
+        if action is None:
+            self.actions.pop(rule, None)
+        else:
+            self.actions[rule] = action
+
+    def analyse(self, tokenStream:Iterable[Token], values:Iterable = None):
+        # 输入序列以END结束, 返回语法树的根节点, 注册了语义动作时返回开始产生式的值
+        actions = self.actions
         stateStack = [self.initState]
-
-        # 构建AST
-        inputStatck = []
-
-        idx = 0
-        followingASTNode = AST(tokenStream[idx]) 
-        
-        while idx < len(tokenStream):
-            action = self.stateToAction[stateStack[-1]][followingASTNode.parent]
-            #接收状态直接返回
-
-            if action.kind == ActionKind.Accept:
-                assert len(inputStatck) == 1 and len(stateStack) == 1
-                return inputStatck[0]
-
-            elif action.kind == ActionKind.Goto:
-                stateStack.append(action.state)
-                inputStatck.append(followingASTNode)
-
-                followingASTNode = AST(tokenStream[idx])
-            
-            elif action.kind == ActionKind.Shift:
-                stateStack.append(action.state)
-                inputStatck.append(followingASTNode)
-
-                idx += 1
-                followingASTNode = AST(tokenStream[idx])
-
-            elif action.kind == ActionKind.Reduce:
-                # 状态栈出栈, 输入栈出栈再入栈
-                stateStack = stateStack[:-len(action.rule)]
-
-                # 构建AST
-                followingASTNode = AST(action.rule.parent, action.rule, inputStatck[-len(action.rule):])
-                inputStatck = inputStatck[:-len(action.rule)]
-
-                # # 输入插入一个规约结果
-                # followingToken = action.rule.parent
-
+        inputStack = []
+        valueIter = None if values is None else iter(values)
+
+        for position, token in enumerate(tokenStream):
+            while True:
+                action = self.row(stateStack[-1]).get(token)
+                if action is None:
+                    raise Exception('语法错误: 位置 %d, 符号 %s' % (position, str(token)))
+
+                if action.kind == ActionKind.Shift:
+                    stateStack.append(action.state)
+                    inputStack.append(token if valueIter is None else next(valueIter))
+                    break
+
+                elif action.kind == ActionKind.Reduce:
+                    rule = action.rule
+                    length = sum(1 for child in rule.child if child is not EPSILON)
+                    children = inputStack[len(inputStack) - length:]
+                    del inputStack[len(inputStack) - length:]
+                    del stateStack[len(stateStack) - length:]
+                    if actions:
+                        inputStack.append(actions.get(rule, defaultAction)(*children))
+                    else:
+                        inputStack.append(AST(rule.parent, rule, children))
+                    stateStack.append(self.row(stateStack[-1])[rule.parent].state)
+
+                else:
+                    assert len(inputStack) == 1
+                    return inputStack.pop()
+
+        raise Exception('语法错误: 输入未以END结束')
@@ -0,0 +1,58 @@
+from entity.Token import VT, END
+from entity.FA import DFA, DFATable
+
+
+class Lexer:
+    """ 词法分析器, 由多个模式的NFA确定化, 最小化并编译得到, 见algorithm.FA.constructLexer
+        每次从当前位置做最长匹配, 长度相同时取优先级最高的模式, 整个输入只映射一次等价类, 逐字符一遍扫描
+        输出的终结符序列以END结束, 可以直接交给LR1_FSA.analyse
+    """
+    def __init__(self, dfa: DFA) -> None:
+        self.dfa = dfa
+        # 接收状态 -> 终结符, 为None时匹配的内容被跳过
+        self.tags = dfa.tags
+        self.table: DFATable = dfa.compile()
+
+    def iterTokens(self, text):
+        """iterTokens 依次返回 (终结符, 开始位置, 结束位置), 跳过标记为None的模式, 不含END
+
+        Args:
+            text: str, bytes 或 memoryview, bytes的字节b视为字符chr(b)
+        """
+        # 与DFATable.match相同的最长匹配, 展开在循环中以省去每个词法单元的函数调用
+        table, tags = self.table, self.tags
+        classes = table.classify(text)
+        rows, flag = table.rows, table.classCount + 1
+        dead, startRow = rows[0], rows[table.start // table.classCount]
+
+        position, length = 0, len(classes)
+        while position < length:
+            row, current, end = startRow, position, -1
+            while current < length:
+                row = row[classes[current]]
+                current += 1
+                if row[flag]:
+                    end, accepted = current, row
+                elif row is dead:
+                    break
+
+            if end < 0:
+                raise Exception('词法错误: 位置 %d, 字符 %r' % (position, text[position:position + 1]))
+            tag = tags[accepted[flag - 1]]
+            if tag is not None:
+                yield tag, position, end
+            position = end
+
+    def tokenize(self, text) -> tuple[list[VT], list]:
+        """tokenize 词法分析
+
+        Returns:
+            tuple[list[VT], list]: 以END结束的终结符序列, 以及每个终结符对应的原文, 可以作为analyse的values
+        """
+        tokens, values = [], []
+        for tag, start, end in self.iterTokens(text):
+            tokens.append(tag)
+            values.append(text[start:end])
+        tokens.append(END)
+        values.append(END.value)
+        return tokens, values
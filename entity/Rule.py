@@ -1,4 +1,4 @@
-from entity.Token import END, Token, VN,VT
+from entity.Token import END, EPSILON, Token, VN,VT
 
 class Rule:
     # 推导规则
@@ -42,3 +42,84 @@ class SingleRule:
 
     def __str__(self) -> str:
         return '%s : %s' % (str(self.parent), ','.join([str(token) for token in self.child]))
+
+
+class Grammar:
+    """ 对文法中的产生式与LR(0)项目统一编号
+        产生式编号为0..n-1, 开始产生式编号为0, 其余按非终结符与产生式排序, 编号与运行无关
+        项目(产生式p, 点的位置dot)编号为稠密整数 itemStart[p] + dot
+        空产生式 E : Epsilon 的产生式体为空元组, 只有一个项目, 即规约项目
+        给出previous时沿用其编号: 仍然存在的产生式编号不变, 已删除的产生式保留编号但不再使用(prodLive为False),
+        新增的产生式编号在最后, 因此两次构造之间项目编号可以直接比较
+        开始产生式改变时不能沿用, 重新编号, 此时reusedNumbering为False
+    """
+    def __init__(self, rules: dict[VN, Rule], beginning: VN, previous: 'Grammar' = None) -> None:
+        assert len(rules[beginning].children) == 1
+
+        self.rules = rules
+        self.beginning = beginning
+
+        # 产生式
+        self.productions: list[SingleRule] = list()
+        self.prodParent: list[VN] = list()
+        self.prodBody: list[tuple] = list()
+        self.prodLive: list[bool] = list()
+        self.prodOf: dict[VN, list[int]] = {vn: list() for vn in rules}
+
+        # 项目
+        self.itemStart: list[int] = list()
+        self.itemProd: list[int] = list()
+        self.itemDot: list[int] = list()
+        self.itemNext: list = list()
+
+        def sortKey(child):
+            return tuple((isinstance(token, VT), str(token.tag)) for token in child)
+
+        parents = [beginning] + sorted((vn for vn in rules if vn is not beginning), key=lambda vn: str(vn.tag))
+        pending = {SingleRule(parent, child): child for parent in parents for child in sorted(rules[parent].children, key=sortKey)}
+
+        # 开始产生式不变时才能沿用编号
+        self.reusedNumbering = previous is not None and previous.productions[0] == SingleRule(beginning, next(iter(rules[beginning].children)))
+        if self.reusedNumbering:
+            for rule in previous.productions:
+                live = rule in pending
+                if live:
+                    del pending[rule]
+                self.addProduction(rule.parent, rule.child, live)
+
+        for rule, child in pending.items():
+            self.addProduction(rule.parent, child)
+
+        # 接受项目 S_ : S ~
+        self.acceptItem = self.itemStart[0] + len(self.prodBody[0])
+
+    def addProduction(self, parent: VN, child, live: bool = True) -> int:
+        prod = len(self.productions)
+        body = tuple(token for token in child if token is not EPSILON)
+
+        self.productions.append(SingleRule(parent, child))
+        self.prodParent.append(parent)
+        self.prodBody.append(body)
+        self.prodLive.append(live)
+        if live:
+            self.prodOf[parent].append(prod)
+
+        self.itemStart.append(len(self.itemProd))
+        for dot in range(len(body) + 1):
+            self.itemProd.append(prod)
+            self.itemDot.append(dot)
+            self.itemNext.append(body[dot] if dot < len(body) else None)
+        return prod
+
+    def itemCount(self) -> int:
+        return len(self.itemProd)
+
+    def itemRest(self, item: int) -> tuple:
+        # 项目中nextToken之后的符号
+        return self.prodBody[self.itemProd[item]][self.itemDot[item] + 1:]
+
+    def itemStr(self, item: int) -> str:
+        prod = self.itemProd[item]
+        childStr = list(token.tag for token in self.prodBody[prod])
+        childStr.insert(self.itemDot[item], '~')
+        return '%s -> %s' % (self.prodParent[prod].tag, ' '.join(childStr))
@@ -0,0 +1,312 @@
+from array import array
+import mmap
+from entity.Token import Token, VN, VT, EPSILON
+from entity.Rule import SingleRule
+from utils.columnFile import saveColumns, loadColumns
+
+# ACTION表项编码, 均为int32
+# 0: 出错; > 0: 移进, 转移到状态 v - 1; ACCEPT: 接受; < ACCEPT: 用产生式 -v - 2 规约
+ERROR = 0
+ACCEPT = -1
+
+# 缓存文件格式见utils.columnFile, 版本2起layout中记录每列的类型
+MAGIC = b'PYLR'
+FORMAT_VERSION = 3
+ARRAY_FIELDS = ('actionBase', 'actionTable', 'actionCheck', 'actionDefault', 'gotoBase', 'gotoTable', 'gotoCheck', 'prodParent', 'prodLen')
+
+def encodeShift(state:int) -> int:
+    return state + 1
+
+def encodeReduce(prod:int) -> int:
+    return -prod - 2
+
+def decodeShift(value:int) -> int:
+    return value - 1
+
+def decodeReduce(value:int) -> int:
+    return -value - 2
+
+# 文件元数据中的符号, 终结符为 ['T', tag, value], 非终结符为 ['N', tag]
+# JSON不保留类型, tag只能为字符串, 终结符的值只能为字符串, 数值或None, 否则加载后得到不同的符号
+def dumpSymbol(token:Token):
+    if not isinstance(token.tag, str):
+        raise Exception('分析表只能保存tag为字符串的符号: %s' % str(token))
+    if isinstance(token, VT):
+        if token.value is not None and not isinstance(token.value, (str, int, float)):
+            raise Exception('分析表只能保存值为字符串或数值的终结符: %s' % str(token))
+        return ['T', token.tag, token.value]
+    return ['N', token.tag]
+
+def loadSymbol(data) -> Token:
+    if data[0] == 'T':
+        return VT(data[1], data[2])
+    return VN(data[1])
+
+# 产生式为 [左部tag, [产生式体的符号]]
+def dumpRule(rule:SingleRule):
+    return [dumpSymbol(rule.parent)[1], [dumpSymbol(token) for token in rule.child]]
+
+def loadRule(data) -> SingleRule:
+    return SingleRule(VN(data[0]), [loadSymbol(token) for token in data[1]])
+
+
+# 行位移压缩(yacc中yypact/yytable的做法)
+# rows[i]为第i行的非空表项 {列: 值}, 将所有行错位叠放进同一个一维数组
+# 返回 base, table, check: 第i行第c列的表项位于 table[base[i] + c], 当 check[base[i] + c] == i 时有效
+# width为列数, table尾部补齐width个空位, 查表时无需检查下标越界
+def packRows(rows:list[dict[int, int]], width:int, empty:int):
+    base = array('i', bytes(4 * len(rows)))
+    table = array('i')
+    check = array('i')
+    occupied = bytearray()
+
+    # 表项多的行先放置, 更容易找到空位
+    order = sorted(range(len(rows)), key=lambda row: len(rows[row]), reverse=True)
+    firstFree = 0
+    for row in order:
+        columns = sorted(rows[row])
+        if not columns:
+            continue
+
+        firstFree = occupied.find(0, firstFree)
+        if firstFree < 0:
+            firstFree = len(occupied)
+
+        # 某一列冲突时, 直接移动到使该列落在下一个空位的位置, 而不是逐个位置尝试
+        offset = max(firstFree - columns[0], 0)
+        placed = False
+        while not placed:
+            placed = True
+            for column in columns:
+                position = offset + column
+                if position < len(occupied) and occupied[position]:
+                    free = occupied.find(0, position)
+                    offset = (free if free >= 0 else len(occupied)) - column
+                    placed = False
+                    break
+
+        end = offset + columns[-1] + 1
+        if end > len(occupied):
+            grow = end - len(occupied)
+            occupied.extend(bytes(grow))
+            table.extend([empty] * grow)
+            check.extend([-1] * grow)
+
+        for column in columns:
+            occupied[offset + column] = 1
+            table[offset + column] = rows[row][column]
+            check[offset + column] = row
+        base[row] = offset
+
+    table.extend([empty] * width)
+    check.extend([-1] * width)
+    return base, table, check
+
+
+class ParseTable:
+    """ 编译后的LR分析表
+        ACTION表为 状态 × 终结符编号, GOTO表为 状态 × 非终结符编号, 表项均为int32, 编码见ERROR/ACCEPT
+        第s行第c列的表项位于 actionTable[actionBase[s] + c]
+        稠密表中actionBase[s] = s * 终结符个数; 压缩表中需检查 actionCheck, 不匹配时取该行的默认规约 actionDefault[s]
+        GOTO表项在分析过程中总是存在, 分析时无需检查gotoCheck
+        数组可以是array, 也可以是从缓存文件映射得到的memoryview
+    """
+    def __init__(self, initState:int, terminals:list[VT], nonterminals:list[VN], productions:list[SingleRule]) -> None:
+        self.initState = initState
+        self.terminals = terminals
+        self.nonterminals = nonterminals
+        self.productions = productions
+        self.terminalIdx:dict[VT, int] = {vt: idx for idx, vt in enumerate(terminals)}
+        self.nonterminalIdx:dict[VN, int] = {vn: idx for idx, vn in enumerate(nonterminals)}
+
+        # 产生式左部的非终结符编号与产生式体长度
+        self.prodParent = array('i', (self.nonterminalIdx[rule.parent] for rule in productions))
+        self.prodLen = array('i', (sum(1 for token in rule.child if token is not EPSILON) for rule in productions))
+
+        self.stateCount = 0
+        self.compressed = False
+        self.actionBase = array('i')
+        self.actionTable = array('i')
+        self.actionCheck:array = None
+        self.actionDefault:array = None
+        self.gotoBase = array('i')
+        self.gotoTable = array('i')
+        self.gotoCheck:array = None
+        # 从缓存文件加载时, 为映射的文件以及保存的构造统计信息与冲突
+        self.buffer:mmap.mmap = None
+        self.stats:dict = dict()
+        self.conflicts:list = list()
+
+    @staticmethod
+    def fromStateToAction(initState:int, stateToAction:dict, compress:bool = False):
+        # 延迟导入, entity.LR1依赖本模块
+        from entity.LR1 import ActionKind
+
+        # 按全局编号排序, 同一进程中列的顺序固定
+        terminals, nonterminals = set(), set()
+        productionIdx:dict[SingleRule, int] = dict()
+        productions:list[SingleRule] = list()
+        # 同一行的规约动作通常是同一个产生式对象, 与上一个相同时跳过产生式的哈希
+        lastRule = None
+        for state in stateToAction:
+            for token, action in stateToAction[state].items():
+                (nonterminals if isinstance(token, VN) else terminals).add(token)
+                if action.kind == ActionKind.Reduce and action.rule is not lastRule:
+                    lastRule = action.rule
+                    if lastRule not in productionIdx:
+                        productionIdx[lastRule] = len(productions)
+                        productions.append(lastRule)
+                        nonterminals.add(lastRule.parent)
+
+        table = ParseTable(initState, sorted(terminals, key=lambda vt: vt.idx), sorted(nonterminals, key=lambda vn: vn.idx), productions)
+
+        actionRows:list[dict[int, int]] = list()
+        gotoRows:list[dict[int, int]] = list()
+        lastRule, lastReduce = None, ERROR
+        for state in range(len(stateToAction)):
+            actionRow, gotoRow = dict(), dict()
+            for token, action in stateToAction[state].items():
+                if action.kind == ActionKind.Goto:
+                    gotoRow[table.nonterminalIdx[token]] = action.state
+                elif action.kind == ActionKind.Shift:
+                    actionRow[table.terminalIdx[token]] = encodeShift(action.state)
+                elif action.kind == ActionKind.Reduce:
+                    if action.rule is not lastRule:
+                        lastRule, lastReduce = action.rule, encodeReduce(productionIdx[action.rule])
+                    actionRow[table.terminalIdx[token]] = lastReduce
+                else:
+                    actionRow[table.terminalIdx[token]] = ACCEPT
+            actionRows.append(actionRow)
+            gotoRows.append(gotoRow)
+
+        table.setRows(actionRows, gotoRows, compress)
+        return table
+
+    def setRows(self, actionRows:list[dict[int, int]], gotoRows:list[dict[int, int]], compress:bool = False):
+        self.stateCount = len(actionRows)
+        self.compressed = compress
+        terminalCount, nonterminalCount = len(self.terminals), len(self.nonterminals)
+
+        if not compress:
+            self.actionBase = array('i', range(0, self.stateCount * terminalCount, terminalCount))
+            self.actionTable = array('i', bytes(4 * self.stateCount * terminalCount))
+            self.gotoBase = array('i', range(0, self.stateCount * nonterminalCount, nonterminalCount))
+            self.gotoTable = array('i', [-1]) * (self.stateCount * nonterminalCount)
+            for state in range(self.stateCount):
+                for column, value in actionRows[state].items():
+                    self.actionTable[self.actionBase[state] + column] = value
+                for column, value in gotoRows[state].items():
+                    self.gotoTable[self.gotoBase[state] + column] = value
+            return
+
+        # 每行出现最多的规约作为默认动作, 不再存入压缩表
+        # 遇到错误输入时可能先执行默认规约, 错误会在移进之前被发现
+        self.actionDefault = array('i', bytes(4 * self.stateCount))
+        packedRows = list()
+        for state in range(self.stateCount):
+            counts = dict()
+            for value in actionRows[state].values():
+                if value < ACCEPT:
+                    counts[value] = counts.get(value, 0) + 1
+            default = max(counts, key=counts.get) if counts else ERROR
+            self.actionDefault[state] = default
+            packedRows.append({column: value for column, value in actionRows[state].items() if value != default})
+
+        self.actionBase, self.actionTable, self.actionCheck = packRows(packedRows, terminalCount, ERROR)
+        self.gotoBase, self.gotoTable, self.gotoCheck = packRows(gotoRows, nonterminalCount, -1)
+
+    def action(self, state:int, column:int) -> int:
+        idx = self.actionBase[state] + column
+        if self.actionCheck is None or self.actionCheck[idx] == state:
+            return self.actionTable[idx]
+        return self.actionDefault[state]
+
+    def goto(self, state:int, column:int) -> int:
+        return self.gotoTable[self.gotoBase[state] + column]
+
+    def nbytes(self) -> int:
+        arrays = [getattr(self, name) for name in ARRAY_FIELDS]
+        return sum(len(data) * data.itemsize for data in arrays if data is not None)
+
+    def __getstate__(self):
+        # 映射的内存无法序列化, 从缓存文件加载的表序列化时复制为array
+        state = dict(self.__dict__)
+        state['buffer'] = None
+        for name in ARRAY_FIELDS:
+            if isinstance(state[name], memoryview):
+                state[name] = array('i', state[name])
+        return state
+
+    def toStateToAction(self) -> dict:
+        """toStateToAction 还原为 {state: {token: Action}} 形式
+            压缩表中出错的表项会还原为该行的默认规约
+        """
+        from entity.LR1 import Action, ActionKind
+
+        stateToAction = dict()
+        for state in range(self.stateCount):
+            row = dict()
+            for column, vt in enumerate(self.terminals):
+                value = self.action(state, column)
+                if value == ACCEPT:
+                    row[vt] = Action(ActionKind.Accept, -1, None)
+                elif value > 0:
+                    row[vt] = Action(ActionKind.Shift, decodeShift(value))
+                elif value < 0:
+                    row[vt] = Action(ActionKind.Reduce, -1, self.productions[decodeReduce(value)])
+
+            for column, vn in enumerate(self.nonterminals):
+                pos = self.gotoBase[state] + column
+                if self.gotoCheck is not None and self.gotoCheck[pos] != state:
+                    continue
+                if self.gotoTable[pos] >= 0:
+                    row[vn] = Action(ActionKind.Goto, self.gotoTable[pos])
+            stateToAction[state] = row
+        return stateToAction
+
+    def save(self, path:str, fingerprint:str = '', stats:dict = None, conflicts:list = None):
+        """save 以二进制格式写入文件, 格式见utils.columnFile
+
+        Args:
+            path (str): 文件路径
+            fingerprint (str): 文法指纹, 加载时用于判断缓存是否失效
+            stats (dict): 构造统计信息
+            conflicts (list[Conflict]): 构造时记录的冲突
+        """
+        meta = {
+            'fingerprint': fingerprint,
+            'initState': self.initState,
+            'stateCount': self.stateCount,
+            'compressed': self.compressed,
+            'terminals': [dumpSymbol(vt) for vt in self.terminals],
+            'nonterminals': [dumpSymbol(vn)[1] for vn in self.nonterminals],
+            'productions': [dumpRule(rule) for rule in self.productions],
+            'stats': stats if stats else dict(),
+            'conflicts': [[conflict.kind.name, conflict.state, dumpSymbol(conflict.token), [dumpRule(rule) for rule in conflict.rules]] for conflict in conflicts or ()],
+        }
+        saveColumns(path, MAGIC, FORMAT_VERSION, meta, {name: getattr(self, name) for name in ARRAY_FIELDS})
+
+    @staticmethod
+    def load(path:str, fingerprint:str = None):
+        """load 将文件映射到内存, 数组直接使用映射的内存, 不复制
+
+        Returns:
+            ParseTable: 格式不符或者指纹不一致时返回None
+        """
+        loaded = loadColumns(path, MAGIC, FORMAT_VERSION, lambda meta: fingerprint is None or meta['fingerprint'] == fingerprint)
+        if loaded is None:
+            return None
+        meta, columns, buffer = loaded
+        # 延迟导入, entity.LR1依赖本模块
+        from entity.LR1 import Conflict, ConflictKind
+
+        productions = [loadRule(data) for data in meta['productions']]
+        table = ParseTable(meta['initState'], [loadSymbol(data) for data in meta['terminals']], [VN(tag) for tag in meta['nonterminals']], productions)
+        table.stateCount = meta['stateCount']
+        table.compressed = meta['compressed']
+        table.stats = meta['stats']
+        table.conflicts = [Conflict(ConflictKind[kind], state, loadSymbol(token), [loadRule(rule) for rule in rules]) for kind, state, token, rules in meta['conflicts']]
+        for name in ARRAY_FIELDS:
+            setattr(table, name, columns.get(name))
+        table.buffer = buffer
+        return table
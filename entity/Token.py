@@ -1,16 +1,19 @@
 class Token:
-    def __init__(self, tag) -> None:
-        self.tag = tag
+    """ 文法符号
+        符号由符号表统一创建, 同一类别同名的符号只存在一个对象, VN('E')总是返回同一个对象
+        因此相等即为同一对象, 比较与哈希直接使用对象身份, 无需每次对tag求哈希
+    """
+    __slots__ = ('tag', 'idx')
 
-    def __eq__(self, o: object) -> bool:
-        if not o:
-            return False
-        if not isinstance(o, VT):
-            return False
-        return self.tag == o.tag
+    def __new__(cls, tag):
+        token = SYMBOL_TABLE.get(cls, tag)
+        if token is None:
+            token = SYMBOL_TABLE.add(object.__new__(cls), tag)
+        return token
 
-    def __hash__(self) -> int:
-        return hash(self.tag)
+    def __reduce__(self):
+        # 反序列化时重新经过符号表, 保证唯一性
+        return (self.__class__, (self.tag,))
 
     def __str__(self) -> str:
         return 'Token(tag: %s)' % self.tag
@@ -18,20 +21,20 @@ class Token:
 
 class VT(Token):
     """ 终结符
+        value以第一次创建时为准
     """    
-    def __init__(self, tag, value) -> None:
-        self.tag = tag
-        self.value = value
-    
-    def __eq__(self, o: object) -> bool:
-        if not o:
-            return False
-        if not isinstance(o, VT):
-            return False
-        return self.tag == o.tag
-
-    def __hash__(self) -> int:
-        return hash(self.tag)
+    __slots__ = ('value', 'bit')
+
+    def __new__(cls, tag, value):
+        token = SYMBOL_TABLE.get(cls, tag)
+        if token is None:
+            token = object.__new__(cls)
+            token.value = value
+            SYMBOL_TABLE.add(token, tag)
+        return token
+
+    def __reduce__(self):
+        return (self.__class__, (self.tag, self.value))
 
     def __str__(self) -> str:
         return 'VT(tag: %s, value: %s)' % (self.tag, str(self.value)) 
@@ -39,22 +42,73 @@ class VT(Token):
 class VN(Token):
     """ 非终结符
     """    
-    def __init__(self, tag) -> None:
-        self.tag = tag
-
-    def __eq__(self, o: object) -> bool:
-        if not o:
-            return False
-        if not isinstance(o, VN):
-            return False
-        return self.tag == o.tag
-
-    def __hash__(self) -> int:
-        return hash(self.tag)
+    __slots__ = ()
 
     def __str__(self) -> str:
         return 'VN(tag: %s)' % (self.tag, ) 
 
+class VTIndex:
+    """ 终结符编号表, 为每个终结符分配稠密的整数编号
+        终结符集合用整数位掩码表示, 第i位为1表示集合包含编号为i的终结符
+        并集, 子集判断等操作均为整数运算, 无需再对终结符求哈希
+    """
+    def __init__(self) -> None:
+        self.vts: list[VT] = list()
+
+    def register(self, vt: VT):
+        vt.idx = len(self.vts)
+        vt.bit = 1 << vt.idx
+        self.vts.append(vt)
+
+    def toMask(self, vts) -> int:
+        mask = 0
+        for vt in vts:
+            mask |= vt.bit
+        return mask
+
+    def iterMask(self, mask: int):
+        # 依次取出最低位的1
+        while mask:
+            low = mask & -mask
+            yield self.vts[low.bit_length() - 1]
+            mask ^= low
+
+    def toSet(self, mask: int) -> set:
+        return set(self.iterMask(mask))
+
+
+class SymbolTable:
+    """ 符号表, 以(类别, tag)为键保存所有符号, 并为符号分配编号
+        终结符的编号由VT_INDEX分配, 非终结符按创建顺序编号
+    """
+    def __init__(self) -> None:
+        self.symbols: dict[tuple, Token] = dict()
+        self.vns: list[VN] = list()
+
+    def get(self, cls, tag):
+        return self.symbols.get((cls, tag))
+
+    def add(self, token: Token, tag):
+        token.tag = tag
+        if isinstance(token, VT):
+            VT_INDEX.register(token)
+        elif isinstance(token, VN):
+            token.idx = len(self.vns)
+            self.vns.append(token)
+        else:
+            token.idx = -1
+        self.symbols[(token.__class__, tag)] = token
+        return token
+
+
+# 全局终结符编号表, 所有位掩码均基于该表
+VT_INDEX = VTIndex()
+SYMBOL_TABLE = SymbolTable()
+
 # 特殊终结符，表示空值
 EPSILON = VT('EPSILON','')
 END = VT('END', '$')
+
+# EPSILON与END的编号固定为0与1
+EPSILON_BIT = EPSILON.bit
+END_BIT = END.bit
\ No newline at end of file
@@ -0,0 +1,258 @@
+from array import array
+import mmap
+from entity.Token import Token, VN, VT
+from entity.Rule import SingleRule
+from entity.Table import ParseTable, dumpSymbol, loadSymbol, dumpRule, loadRule
+from utils.columnFile import saveColumns, loadColumns
+
+# 文件格式见utils.columnFile
+TREE_MAGIC = b'PYLT'
+TREE_FORMAT_VERSION = 2
+# 保存的列, 符号与子节点个数由产生式决定, firstChild为子节点个数的前缀和, 均不保存
+COLUMN_FIELDS = ('production', 'spanStart', 'spanEnd', 'children', 'tokens')
+# 各类型能表示的最大值, 以及超出时加宽后的类型
+TYPE_LIMIT = {'B': 0xff, 'H': 0xffff, 'I': 0xffffffff, 'b': 0x7f, 'h': 0x7fff, 'i': 0x7fffffff}
+WIDER = {'B': 'H', 'H': 'I', 'b': 'h', 'h': 'i'}
+
+def indexType(count:int) -> str:
+    # 能容纳 [0, count) 的最窄无符号类型
+    if count <= 0x100:
+        return 'B'
+    if count <= 0x10000:
+        return 'H'
+    return 'I'
+
+
+def widen(column:array, value:int) -> array:
+    # 返回能容纳 |value| 的列, 必要时复制为更宽的类型
+    typecode = column.typecode
+    while TYPE_LIMIT[typecode] < value:
+        typecode = WIDER[typecode]
+    return column if typecode == column.typecode else array(typecode, column)
+
+
+class TreeNode:
+    """ 紧凑语法树中节点的视图, 只保存树与下标, 属性在访问时从列中读取
+        下标 >= 0 为内部节点, 叶子节点的下标为 ~位置
+    """
+    __slots__ = ('tree', 'index')
+
+    def __init__(self, tree, index:int) -> None:
+        self.tree:CompactTree = tree
+        self.index = index
+
+    @property
+    def isLeaf(self) -> bool:
+        return self.index < 0
+
+    @property
+    def symbol(self) -> Token:
+        tree = self.tree
+        if self.index < 0:
+            return tree.symbols[tree.tokens[~self.index]]
+        return tree.symbols[tree.prodSymbol[tree.production[self.index]]]
+
+    @property
+    def rule(self) -> SingleRule:
+        if self.index < 0:
+            return None
+        return self.tree.productions[self.tree.production[self.index]]
+
+    @property
+    def span(self) -> tuple[int, int]:
+        # 覆盖的终结符位置区间 [start, end)
+        if self.index < 0:
+            return ~self.index, ~self.index + 1
+        return self.tree.spanStart[self.index], self.tree.spanEnd[self.index]
+
+    @property
+    def children(self) -> list:
+        tree = self.tree
+        return [TreeNode(tree, child) for child in tree.childIndices(self.index)]
+
+    def __eq__(self, o: object) -> bool:
+        return isinstance(o, TreeNode) and self.tree is o.tree and self.index == o.index
+
+    def __hash__(self) -> int:
+        return hash((id(self.tree), self.index))
+
+    def __str__(self) -> str:
+        return 'TreeNode(%s, %d:%d)' % ((self.symbol.tag,) + self.span)
+
+
+class CompactTree:
+    """ 列式存储的语法树, 每一列为一个数组, 第i个元素为第i个内部节点的属性
+        production: 产生式编号, 节点的符号与子节点个数由产生式决定, 不单独存储
+        spanStart/spanEnd: 覆盖的终结符位置区间
+        子节点为 children[firstChild : firstChild + 子节点个数], firstChild为子节点个数的前缀和, 访问时计算
+        叶子节点不单独存储, 在children中记为 ~位置, 其终结符编号为 tokens[位置]
+        节点按规约顺序编号, 即后序遍历的顺序, 根节点编号最大
+        位置与下标的列从最窄的类型开始, 超出范围时加宽
+        列可以是array, 也可以是从文件映射得到的memoryview
+    """
+    def __init__(self, terminals:list[VT], nonterminals:list[VN], productions:list[SingleRule], prodParent, prodLen) -> None:
+        self.terminals = terminals
+        self.nonterminals = nonterminals
+        self.symbols:list[Token] = list(terminals) + list(nonterminals)
+        self.productions = productions
+        self.prodLen = prodLen
+        # 内部节点的符号编号
+        self.prodSymbol = [len(terminals) + parent for parent in prodParent]
+        self.root = -1
+
+        self.production = array(indexType(len(productions)))
+        self.spanStart = array('B')
+        self.spanEnd = array('B')
+        self.children = array('b')
+        self.tokens = array(indexType(len(terminals)))
+        # 由production计算的子节点起点, 节点增加后重新计算
+        self.firstChild:array = None
+        # 从文件加载时, 为映射的文件
+        self.buffer:mmap.mmap = None
+
+    @staticmethod
+    def fromTable(table:ParseTable):
+        return CompactTree(table.terminals, table.nonterminals, table.productions, table.prodParent, table.prodLen)
+
+    def addLeaf(self, column:int, position:int) -> int:
+        self.tokens.append(column)
+        return ~position
+
+    def addNode(self, prod:int, children, position:int) -> int:
+        """addNode 规约时添加内部节点
+
+        Args:
+            prod (int): 产生式编号
+            children: 子节点下标, 叶子节点为 ~位置
+            position (int): 当前位置, 即已移进的终结符个数, 为节点覆盖区间的终点
+
+        Returns:
+            int: 新节点的下标
+        """
+        index = len(self.production)
+        if position > TYPE_LIMIT[self.spanEnd.typecode]:
+            self.spanStart = widen(self.spanStart, position)
+            self.spanEnd = widen(self.spanEnd, position)
+        # 子节点的下标小于index, 叶子节点 ~p 的绝对值不超过position + 1
+        if max(index, position + 1) > TYPE_LIMIT[self.children.typecode]:
+            self.children = widen(self.children, max(index, position + 1))
+
+        self.production.append(prod)
+        if children:
+            first = children[0]
+            self.spanStart.append(~first if first < 0 else self.spanStart[first])
+            self.children.extend(children)
+        else:
+            self.spanStart.append(position)
+        self.spanEnd.append(position)
+        return index
+
+    def firstChildren(self):
+        # 子节点个数的前缀和, 第一次访问子节点时计算并缓存
+        if self.firstChild is None or len(self.firstChild) != len(self.production):
+            prodLen = self.prodLen
+            firstChild = array(indexType(len(self.children) + 1))
+            offset = 0
+            for prod in self.production:
+                firstChild.append(offset)
+                offset += prodLen[prod]
+            self.firstChild = firstChild
+        return self.firstChild
+
+    def __len__(self) -> int:
+        return len(self.production)
+
+    def childCount(self, index:int) -> int:
+        return self.prodLen[self.production[index]] if index >= 0 else 0
+
+    def childIndices(self, index:int):
+        if index < 0:
+            return ()
+        first = self.firstChildren()[index]
+        return self.children[first:first + self.prodLen[self.production[index]]]
+
+    def node(self, index:int = None) -> TreeNode:
+        return TreeNode(self, self.root if index is None else index)
+
+    def preorder(self, index:int = None):
+        """preorder 先序遍历, 依次返回节点视图, 包括叶子节点
+        """
+        firstChild, production, prodLen = self.firstChildren(), self.production, self.prodLen
+        stack = [self.root if index is None else index]
+        while stack:
+            index = stack.pop()
+            yield TreeNode(self, index)
+            if index >= 0:
+                first = firstChild[index]
+                stack.extend(reversed(self.children[first:first + prodLen[production[index]]]))
+
+    def postorder(self, index:int = None):
+        """postorder 后序遍历, 依次返回节点视图, 包括叶子节点
+        """
+        # 栈中为 (节点, 下一个要访问的子节点序号)
+        firstChild, production, prodLen = self.firstChildren(), self.production, self.prodLen
+        stack = [(self.root if index is None else index, 0)]
+        while stack:
+            index, cursor = stack[-1]
+            if index >= 0 and cursor < prodLen[production[index]]:
+                stack[-1] = (index, cursor + 1)
+                stack.append((self.children[firstChild[index] + cursor], 0))
+            else:
+                stack.pop()
+                yield TreeNode(self, index)
+
+    def nbytes(self) -> int:
+        # 保存的各列的大小, 不含访问时计算的firstChild
+        columns = [getattr(self, name) for name in COLUMN_FIELDS]
+        return sum(len(column) * column.itemsize for column in columns)
+
+    def __getstate__(self):
+        # 映射的内存无法序列化, 各列统一保存为 (类型, 字节串)
+        state = dict(self.__dict__)
+        state['buffer'] = None
+        state['firstChild'] = None
+        for name in COLUMN_FIELDS:
+            column = getattr(self, name)
+            state[name] = (column.format if isinstance(column, memoryview) else column.typecode, bytes(memoryview(column).cast('B')))
+        return state
+
+    def __setstate__(self, state):
+        for name in COLUMN_FIELDS:
+            typecode, data = state[name]
+            column = array(typecode)
+            column.frombytes(data)
+            state[name] = column
+        self.__dict__.update(state)
+
+    def save(self, path:str):
+        """save 以二进制格式写入文件, 格式见utils.columnFile, 加载时各列直接映射到内存
+        """
+        meta = {
+            'root': self.root,
+            'terminals': [dumpSymbol(vt) for vt in self.terminals],
+            'nonterminals': [dumpSymbol(vn)[1] for vn in self.nonterminals],
+            'productions': [dumpRule(rule) for rule in self.productions],
+            'prodParent': [symbol - len(self.terminals) for symbol in self.prodSymbol],
+            'prodLen': list(self.prodLen),
+        }
+        saveColumns(path, TREE_MAGIC, TREE_FORMAT_VERSION, meta, {name: getattr(self, name) for name in COLUMN_FIELDS})
+
+    @staticmethod
+    def load(path:str):
+        """load 将文件映射到内存, 各列直接使用映射的内存, 不复制
+
+        Returns:
+            CompactTree: 格式不符时返回None
+        """
+        loaded = loadColumns(path, TREE_MAGIC, TREE_FORMAT_VERSION)
+        if loaded is None:
+            return None
+        meta, columns, buffer = loaded
+
+        productions = [loadRule(data) for data in meta['productions']]
+        tree = CompactTree([loadSymbol(data) for data in meta['terminals']], [VN(tag) for tag in meta['nonterminals']], productions, meta['prodParent'], meta['prodLen'])
+        tree.root = meta['root']
+        for name in COLUMN_FIELDS:
+            setattr(tree, name, columns[name])
+        tree.buffer = buffer
+        return tree
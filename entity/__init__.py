@@ -1 +1 @@
-__all__ = ['LR1', 'Rule', 'Token']
\ No newline at end of file
+__all__ = ['Lexer', 'LR1', 'Rule', 'Table', 'Token', 'Tree']
\ No newline at end of file
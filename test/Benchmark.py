@@ -0,0 +1,254 @@
+import keyword
+import random
+import time
+import tracemalloc
+from entity.Token import VN, VT, END
+from entity.Rule import Rule, Grammar
+from entity.LR1 import LRMode
+from entity.FA import MNFA
+from algorithm.Common import constructFirstMask
+from algorithm.FA import RegExpToNFA, RegExpToDFA, constructLexer
+from algorithm.LR1 import constructLR1, constructRestFirst, constructClosureTemplates, constructCanonicalCollection, constructActionTable
+from test.Test import exprGrammar
+
+# 性能测试, 打印耗时, 不做断言
+
+# 分析耗时应与输入长度成线性关系, 与栈的深度无关
+# flat: id + id * id + ... 栈很浅; nested: ( ( ... id ... ) ) 栈深度与输入长度成正比
+def benchAnalyse(sizes=(10000, 100000, 1000000)):
+    rules, S, tokens = exprGrammar()
+    PLUS, MUL, LB, RB, ID = tokens[4:]
+    fsa = constructLR1(rules, S, tokens, mode=LRMode.LALR1)
+
+    for compress in (False, True):
+        fsa.compile(compress)
+        for size in sizes:
+            flat = [ID]
+            while len(flat) < size:
+                flat += [PLUS, ID, MUL, ID]
+            flat.append(END)
+
+            depth = size // 2
+            nested = [LB] * depth + [ID] + [RB] * depth + [END]
+
+            for name, tokenStream in (('flat', flat), ('nested', nested)):
+                start = time.perf_counter()
+                fsa.analyse(tokenStream)
+                cost = time.perf_counter() - start
+                print('compress: %-5s %-6s %8d tokens: %.3fs, %.0f ns/token' % (compress, name, len(tokenStream), cost, cost / len(tokenStream) * 1e9))
+
+
+# 终结符很多的文法: S : L, L : L stmt | stmt, stmt_i : kw_i arg Semi, arg : Id | Num | ( arg )
+# 状态数与终结符个数成正比, 每个状态只在少数符号上有转移
+def keywordGrammar(keywords):
+    S, L, STMT, ARG = VN('KwS'), VN('KwL'), VN('KwStmt'), VN('KwArg')
+    SEMI, ID, NUM, LB, RB = VT('Semi', ';'), VT('Id', 'id'), VT('Num', 'num'), VT('Lb', '('), VT('Rb', ')')
+    kws = [VT('Kw%d' % i, 'kw%d' % i) for i in range(keywords)]
+
+    rules = {S:Rule(S, [(L,)]), L:Rule(L, [(L, STMT), (STMT,)]), STMT:Rule(STMT, [(kw, ARG, SEMI) for kw in kws]), ARG:Rule(ARG, [(ID,), (NUM,), (LB, ARG, RB)])}
+    tokens = [S, L, STMT, ARG, SEMI, ID, NUM, LB, RB] + kws
+    return rules, S, tokens
+
+
+# 项目集族的构造耗时应与状态数近似成线性关系, 与符号个数无关
+# 分析表的表项数为 状态数 × 规约的展望符个数, 单独计时
+def benchConstruct(sizes=(64, 256, 1024)):
+    for keywords in sizes:
+        rules, S, tokens = keywordGrammar(keywords)
+        grammar = Grammar(rules, S)
+        restFirst = constructRestFirst(grammar, constructFirstMask(rules))
+        templates = constructClosureTemplates(grammar, restFirst)
+
+        start = time.perf_counter()
+        states, transitions = constructCanonicalCollection(grammar, restFirst, templates, tokens)
+        cost = time.perf_counter() - start
+        start = time.perf_counter()
+        constructActionTable(grammar, states, transitions)
+        tableCost = time.perf_counter() - start
+        print('%5d tokens %6d states: collection %.3fs (%.1f us/state), table %.3fs' % (len(tokens), len(states), cost, cost / len(states) * 1e6, tableCost))
+
+
+# AST与CompactTree的内存占用(tracemalloc统计的每个终结符的字节数)与耗时
+def benchTree(size=200000):
+    rules, S, tokens = exprGrammar()
+    PLUS, MUL, LB, RB, ID = tokens[4:]
+    fsa = constructLR1(rules, S, tokens, mode=LRMode.LALR1)
+    fsa.compile(True)
+
+    tokenStream = [ID]
+    while len(tokenStream) < size:
+        tokenStream += [PLUS, ID, MUL, ID]
+    tokenStream.append(END)
+
+    for compact in (False, True):
+        start = time.perf_counter()
+        fsa.analyse(tokenStream, compact=compact)
+        cost = time.perf_counter() - start
+
+        tracemalloc.start()
+        result = fsa.analyse(tokenStream, compact=compact)
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del result
+        print('compact: %-5s %8d tokens: %.3fs, %.1f bytes/token, peak %.1f bytes/token' % (compact, len(tokenStream), cost, current / len(tokenStream), peak / len(tokenStream)))
+
+
+# 词法规则: keywords个关键字与标识符 [a,...,z]([a,...,z,0,...,9])* 的分支
+def lexerPattern(keywords):
+    letters = ','.join('abcdefghijklmnopqrstuvwxyz')
+    digits = ','.join('0123456789')
+    words = ['kw%s' % ''.join('abcdefghij'[int(d)] for d in str(i)) for i in range(keywords)]
+    return '[%s,[%s]([%s,%s])*]' % (','.join(words), letters, letters, digits)
+
+
+# 子集法的耗时应与生成的DFA规模成正比
+def benchSubsetConstruction(sizes=(50, 200, 800)):
+    for keywords in sizes:
+        pattern = lexerPattern(keywords)
+        start = time.perf_counter()
+        nfa = RegExpToNFA(pattern)
+        compileCost = time.perf_counter() - start
+
+        start = time.perf_counter()
+        dfa = nfa.toDFA()
+        cost = time.perf_counter() - start
+        print('%4d keywords: NFA %6d states %.3fs, DFA %6d states %.3fs' % (keywords, nfa.stateCount(), compileCost, len(dfa.stateMap), cost))
+
+
+# 最小化前后的状态数与逐字符扫描的耗时
+# python: Python的关键字; words: 随机单词的分支, 子集法得到前缀树, 最小化合并相同的后缀
+def benchMinimize(sizes=(500, 2000)):
+    cases = [('python', '[%s]' % ','.join(keyword.kwlist), keyword.kwlist)]
+    rand = random.Random(0)
+    for count in sizes:
+        words = sorted(set(''.join(rand.choice('etaoinshrdlucmfw') for _ in range(rand.randint(2, 9))) for _ in range(count)))
+        cases.append(('words', '[%s]' % ','.join(words), words))
+
+    for name, pattern, words in cases:
+        dfa = RegExpToDFA(pattern)
+        start = time.perf_counter()
+        minimized = dfa.minimize()
+        cost = time.perf_counter() - start
+
+        text = words * max(1, 200000 // sum(map(len, words)))
+        chars = sum(map(len, text))
+        scanCost = []
+        for automaton in (dfa, minimized):
+            start = time.perf_counter()
+            for word in text:
+                automaton.state = automaton.beginningState
+                for c in word:
+                    automaton.consume(c)
+                assert automaton.accept()
+            scanCost.append(time.perf_counter() - start)
+        print('%-8s %6d -> %5d states, minimize %.3fs, scan %.0f -> %.0f ns/char' % (name, len(dfa.stateMap), len(minimized.stateMap), cost, scanCost[0] / chars * 1e9, scanCost[1] / chars * 1e9))
+
+
+# 逐字符consume与编译后的转移表的每字符耗时, 输入为由空格分隔的标识符与数字
+def benchScan(size=1000000):
+    letters = ','.join('abcdefghijklmnopqrstuvwxyz')
+    digits = ','.join('0123456789')
+    dfa = RegExpToDFA('([[%s]([%s,%s])*,[%s]+] )*' % (letters, letters, digits, digits)).minimize()
+    table = dfa.compile()
+
+    rand = random.Random(0)
+    words = []
+    length = 0
+    while length < size:
+        word = ''.join(rand.choice('abcdefghijklmnopqrstuvwxyz0123456789') for _ in range(rand.randint(1, 12)))
+        word = str(rand.randint(0, 99999)) if word[0].isdigit() else word
+        words.append(word + ' ')
+        length += len(word) + 1
+    text = ''.join(words)
+    data = text.encode('latin-1')
+
+    start = time.perf_counter()
+    dfa.state = dfa.beginningState
+    for c in text:
+        dfa.consume(c)
+    assert dfa.accept()
+    base = time.perf_counter() - start
+    print('consume %8d chars: %.3fs, %.0f ns/char' % (len(text), base, base / len(text) * 1e9))
+
+    for name, buffer in (('str', text), ('bytes', data), ('memoryview', memoryview(data))):
+        start = time.perf_counter()
+        assert table.accepts(buffer)
+        cost = time.perf_counter() - start
+        print('run     %-10s: %.3fs, %.0f ns/char, %.1fx' % (name, cost, cost / len(text) * 1e9, base / cost))
+
+    # 最长匹配: 逐个单词匹配, 输入只映射一次
+    word = RegExpToDFA('[[%s]([%s,%s])*,[%s]+]' % (letters, letters, digits, digits)).minimize().compile()
+    start = time.perf_counter()
+    classes = word.classify(text)
+    position = 0
+    while position < len(text):
+        end, state = word.match(classes, position)
+        position = end + 1
+    cost = time.perf_counter() - start
+    print('match   %8d words: %.3fs, %.0f ns/char' % (len(words), cost, cost / len(text) * 1e9))
+
+
+# 词法分析: Python关键字, 标识符, 数字, 运算符与空白, 以及 词法分析 + LR分析 的整体耗时
+def benchLexer(size=1000000):
+    letters = ','.join('abcdefghijklmnopqrstuvwxyz_')
+    digits = ','.join('0123456789')
+    keywords = [(word, VT('Kw_' + word, word)) for word in keyword.kwlist if word.islower()]
+    operators = [(op, VT('Op' + op, op)) for op in ('+', '-', '*', '/', '=', '==', '<', '<=', '(', ')', ':')]
+    rules = keywords + [('[%s]([%s,%s])*' % (letters, letters, digits), VT('Id', 'id')), ('[%s]+' % digits, VT('Num', 'num'))]
+    rules += [(''.join('\\' + c for c in op), vt) for op, vt in operators] + [('[ ,\\n]+', None)]
+
+    start = time.perf_counter()
+    nfa = MNFA()
+    for pattern, vt in rules:
+        nfa.addPattern(pattern, vt)
+    dfa = nfa.toDFA()
+    minimized = dfa.minimize()
+    buildCost = time.perf_counter() - start
+    lexer = constructLexer(rules)
+    print('lexer: %d rules, NFA %d states, DFA %d -> %d states, %d classes, build %.3fs' % (len(rules), nfa.stateCount(), len(dfa.stateMap), len(minimized.stateMap), lexer.table.classCount, buildCost))
+
+    rand = random.Random(0)
+    words = [word for word, vt in keywords + operators] + ['x', 'count', 'value_1', 'i', '0', '42', '65535']
+    pieces = []
+    length = 0
+    while length < size:
+        piece = rand.choice(words) + rand.choice((' ', ' ', '\n'))
+        pieces.append(piece)
+        length += len(piece)
+    text = ''.join(pieces)
+
+    for name, buffer in (('str', text), ('bytes', text.encode('latin-1'))):
+        start = time.perf_counter()
+        tokenStream, values = lexer.tokenize(buffer)
+        cost = time.perf_counter() - start
+        print('tokenize %-5s %8d chars %7d tokens: %.3fs, %.1f MB/s, %.0f ns/token' % (name, len(text), len(tokenStream), cost, len(text) / cost / 1e6, cost / len(tokenStream) * 1e9))
+
+    # 表达式文法的输入 x1 + x2 * ( x3 + ... ) 先词法分析再LR分析
+    rules, S, tokens = exprGrammar()
+    PLUS, MUL, LB, RB, ID = tokens[4:]
+    exprLexer = constructLexer([('[%s]([%s,%s])*' % (letters, letters, digits), ID), ('\\+', PLUS), ('\\*', MUL), ('\\(', LB), ('\\)', RB), ('[ ,\\n]+', None)])
+    fsa = constructLR1(rules, S, tokens, mode=LRMode.LALR1)
+    fsa.compile(True)
+    pieces = []
+    length = 0
+    while length < size:
+        pieces.append('x%d + y%d * (z + w) * ' % (length % 97, length % 89))
+        length += len(pieces[-1])
+    text = ''.join(pieces) + 'x'
+
+    start = time.perf_counter()
+    tokenStream, values = exprLexer.tokenize(text)
+    lexCost = time.perf_counter() - start
+    fsa.analyse(tokenStream)
+    cost = time.perf_counter() - start
+    print('lex + parse %8d chars %7d tokens: lex %.3fs, total %.3fs, %.0f ns/token' % (len(text), len(tokenStream), lexCost, cost, cost / len(tokenStream) * 1e9))
+
+
+if __name__ == '__main__':
+    benchAnalyse()
+    benchTree()
+    benchConstruct()
+    benchSubsetConstruction()
+    benchMinimize()
+    benchScan()
+    benchLexer()
@@ -1,9 +1,36 @@
+import importlib.util
+import os
+import pickle
+import tempfile
+import tracemalloc
 from typing import Iterable
 from entity.Token import Token, VN, VT, EPSILON, END
-from entity.Rule import Rule
+from entity.Rule import Rule, SingleRule
 from utils.formatedPrint import printSet
 from algorithm.Common import constructFirstSet,constructFollowSet
-from algorithm.LR1 import constructLR1
+from algorithm.LR1 import constructLR1, compareLRModes, constructLR1Cached, constructLR1Lazy, constructLR1Incremental
+from algorithm.Generator import generateParser
+from algorithm.FA import RegExpToNFA, RegExpToDFA, constructLexer
+import algorithm.LR1 as LR1
+from entity.LR1 import LRMode, ConflictKind, ConflictError
+from entity.Tree import CompactTree
+from entity.FA import DFA
+
+# 将AST转为嵌套的元组, 便于比较两棵语法树
+def toTuple(node):
+    if isinstance(node, VT):
+        return node
+    return (node.parent, [toTuple(child) for child in node.children])
+
+
+# 断言call()抛出异常, 返回该异常
+def assertRaises(call):
+    try:
+        call()
+    except Exception as error:
+        return error
+    raise AssertionError('没有抛出异常')
+
 
 # 将更新过程视为有向图,节点
 # 为非终结符,边为更新过程,可以拓扑排序优化构造过程
@@ -35,6 +62,18 @@ def testConstructFirstSet():
     First = constructFirstSet(rules)
 
     printSet(First)
+    assert First[E] == First[T] == First[F] == {LB, ID}
+    assert First[E_] == {PLUS, EPSILON} and First[T_] == {MUL, EPSILON}
+
+    # 相互递归且可空的环 A : B | a, B : A | C | ε 缩为一点; R : L, L : R | x 为不可空的环
+    S, A, B, C, R, L = VN('CycleS'), VN('CycleA'), VN('CycleB'), VN('CycleC'), VN('CycleR'), VN('CycleL')
+    a, c, x, z = VT('a','a'), VT('c','c'), VT('x','x'), VT('z','z')
+    rules = {S:Rule(S, [(A, B, z), (R,)]), A:Rule(A, [(B,), (a,)]), B:Rule(B, [(A,), (C,), (EPSILON,)]), C:Rule(C, [(c,)]), R:Rule(R, [(L,)]), L:Rule(L, [(R,), (x,)])}
+
+    First = constructFirstSet(rules)
+    assert First[A] == First[B] == {a, c, EPSILON}
+    assert First[R] == First[L] == {x}
+    assert First[S] == {a, c, z, x}
 
 
 
@@ -69,6 +108,18 @@ def testConstructFollowSet():
 
     # printSet(First)
     printSet(Follow)
+    assert Follow[E] == Follow[E_] == {RB, END}
+    assert Follow[T] == Follow[T_] == {PLUS, RB, END}
+    assert Follow[F] == {PLUS, MUL, RB, END}
+
+    # Follow沿环传播: A : B 与 B : A 使Follow(A) = Follow(B), 并经 B : C 传给C
+    S, A, B, C, R, L = VN('CycleS'), VN('CycleA'), VN('CycleB'), VN('CycleC'), VN('CycleR'), VN('CycleL')
+    a, c, x, z = VT('a','a'), VT('c','c'), VT('x','x'), VT('z','z')
+    rules = {S:Rule(S, [(A, B, z), (R,)]), A:Rule(A, [(B,), (a,)]), B:Rule(B, [(A,), (C,), (EPSILON,)]), C:Rule(C, [(c,)]), R:Rule(R, [(L,)]), L:Rule(L, [(R,), (x,)])}
+
+    Follow = constructFollowSet(rules, constructFirstSet(rules), S)
+    assert Follow[S] == Follow[R] == Follow[L] == {END}
+    assert Follow[A] == Follow[B] == Follow[C] == {a, c, z}
 
 
 
@@ -131,5 +182,479 @@ def testConstructLR1():
     rules = {S_:rule_S_, S:rule_S,L:rule_L,R:rule_R}
     tokens = [S,L,R,Eq,Pt,Id]
 
+    fsa = constructLR1(rules,S_,tokens)
+    assert len(fsa.stateToAction) == 14 and not fsa.conflicts
+
+    # id = * id 与 * id 可以接受, id = 不可以
+    for tokenStream in ([Id, Eq, Pt, Id, END], [Pt, Id, END]):
+        assert fsa.analyse(tokenStream).parent is S
+    assertRaises(lambda: fsa.analyse([Id, Eq, END]))
+
+
+# 构建LALR(1)自动机
+# 合并核心相同的项目集, 状态数少于规范LR(1), 但可能引入规约-规约冲突
+def testConstructLALR1():
+    S_,S,L,R = VN('S_'), VN('S'), VN('L'), VN('R')
+    Eq, Pt, Id = VT('Eq','='), VT('Pt', '*'), VT('Id', 'id')
+
+    rules = {S_:Rule(S_, [(S,)]), S:Rule(S, [(L,Eq,R), (R,)]), L:Rule(L, [(Pt,R), (Id,)]), R:Rule(R, [(L,)])}
+    tokens = [S,L,R,Eq,Pt,Id]
+
+    lr1 = constructLR1(rules,S_,tokens)
+    lalr1 = constructLR1(rules,S_,tokens,mode=LRMode.LALR1)
+    print('LR(1) states: %d, LALR(1) states: %d' % (len(lr1.stateToAction), len(lalr1.stateToAction)))
+    assert len(lr1.stateToAction) == 14 and len(lalr1.stateToAction) == 10
+
+    # S_ : S, S : a A d | b B d | a B e | b A e, A : c, B : c
+    # 该文法为LR(1)文法, 但合并后产生规约-规约冲突
+    A, B = VN('A'), VN('B')
+    a, b, c, d, e = VT('a','a'), VT('b','b'), VT('c','c'), VT('d','d'), VT('e','e')
+    rules = {S_:Rule(S_, [(S,)]), S:Rule(S, [(a,A,d), (b,B,d), (a,B,e), (b,A,e)]), A:Rule(A, [(c,)]), B:Rule(B, [(c,)])}
+    tokens = [S,A,B,a,b,c,d,e]
+
     constructLR1(rules,S_,tokens)
+    try:
+        constructLR1(rules,S_,tokens,mode=LRMode.LALR1)
+        assert False
+    except ConflictError as error:
+        for conflict in error.conflicts:
+            print(str(conflict))
+        assert error.conflicts and all(conflict.kind == ConflictKind.ReduceReduce for conflict in error.conflicts)
+
+
+# 构建Pager最小LR(1)自动机, 并比较各种构造方式的状态数
+def testConstructPager():
+    S_,S,L,R = VN('S_'), VN('S'), VN('L'), VN('R')
+    Eq, Pt, Id = VT('Eq','='), VT('Pt', '*'), VT('Id', 'id')
+
+    rules = {S_:Rule(S_, [(S,)]), S:Rule(S, [(L,Eq,R), (R,)]), L:Rule(L, [(Pt,R), (Id,)]), R:Rule(R, [(L,)])}
+    tokens = [S,L,R,Eq,Pt,Id]
 
+    stats = compareLRModes(rules,S_,tokens)
+    for mode in stats:
+        print(mode.name, stats[mode])
+    assert stats[LRMode.Pager]['states'] == stats[LRMode.LALR1]['states'] == 10
+
+    # 调用方已经在跟踪内存时, 不停止跟踪也不重置调用方的峰值
+    tracemalloc.start()
+    try:
+        buffer = bytearray(1 << 22)
+        del buffer
+        fsa = constructLR1(rules,S_,tokens,traceMemory=True)
+        assert tracemalloc.is_tracing() and tracemalloc.get_traced_memory()[1] >= 1 << 22
+        assert fsa.stats['peakMemory'] > 0
+    finally:
+        tracemalloc.stop()
+
+    # LR(1)文法, LALR(1)合并会产生冲突, Pager合并不会
+    A, B = VN('A'), VN('B')
+    a, b, c, d, e = VT('a','a'), VT('b','b'), VT('c','c'), VT('d','d'), VT('e','e')
+    rules = {S_:Rule(S_, [(S,)]), S:Rule(S, [(a,A,d), (b,B,d), (a,B,e), (b,A,e)]), A:Rule(A, [(c,)]), B:Rule(B, [(c,)])}
+    tokens = [S,A,B,a,b,c,d,e]
+
+    fsa = constructLR1(rules,S_,tokens,mode=LRMode.Pager)
+    assert not fsa.conflicts
+    print(fsa.stats)
+
+
+# 表达式文法 S : E, E : E + T | T, T : T * F | F, F : ( E ) | id
+def exprGrammar():
+    S, E, T, F = VN('S'), VN('E'), VN('T'), VN('F')
+    PLUS, MUL, LB, RB, ID = VT('Plus','+'), VT('Mul','*'), VT('Lb','('), VT('Rb', ')'), VT('Id', 'id')
+
+    rules = {S:Rule(S, [(E,)]), E:Rule(E, [(E,PLUS,T), (T,)]), T:Rule(T, [(T,MUL,F), (F,)]), F:Rule(F, [(LB,E,RB), (ID,)])}
+    tokens = [S, E, T, F, PLUS, MUL, LB, RB, ID]
+    return rules, S, tokens
+
+
+# 将分析表编译为数组, 分别使用稠密表与压缩表分析 id + id * ( id )
+def testCompileTable():
+    rules, S, tokens = exprGrammar()
+    PLUS, MUL, LB, RB, ID = tokens[4:]
+    E = VN('E')
+
+    fsa = constructLR1(rules, S, tokens)
+    tokenStream = [ID, PLUS, ID, MUL, LB, ID, RB, END]
+
+    for compress in (False, True):
+        table = fsa.compile(compress)
+        print('compress: %s, %d states, %d bytes' % (compress, table.stateCount, table.nbytes()))
+
+        ast = fsa.analyse(tokenStream)
+        assert ast.parent is E and len(ast.children) == 3 and ast.children[1] is PLUS
+
+        print(str(assertRaises(lambda: fsa.analyse([ID, PLUS, END]))))
+
+
+# 分析表缓存, 第二次构建时直接映射缓存文件, 文法改变后缓存失效
+def testConstructLR1Cached():
+    rules, S, tokens = exprGrammar()
+    PLUS, MUL, LB, RB, ID = tokens[4:]
+    E, F = VN('E'), VN('F')
+    tokenStream = [ID, PLUS, ID, MUL, LB, ID, RB, END]
+
+    with tempfile.TemporaryDirectory() as cacheDir:
+        cachePath = os.path.join(cacheDir, 'expr.lrt')
+
+        fsa = constructLR1Cached(rules, S, tokens, cachePath, compress=True)
+        assert fsa.table.buffer is None and os.path.exists(cachePath)
+
+        cached = constructLR1Cached(rules, S, tokens, cachePath, compress=True)
+        assert cached.table.buffer is not None
+        assert cached.stats['states'] == fsa.stats['states']
+        assert cached.analyse(tokenStream).parent is VN('E')
+
+        rules[F].addChild((PLUS, F))
+        rebuilt = constructLR1Cached(rules, S, tokens, cachePath, compress=True)
+        assert rebuilt.table.buffer is None
+        assert rebuilt.analyse([PLUS, ID, END]).parent is VN('E')
+
+        # 冲突与分析表一同缓存, 命中缓存时结果与重新构造相同
+        A, B, c = VN('A'), VN('B'), VT('c', 'c')
+        conflictRules = {S:Rule(S, [(E,)]), E:Rule(E, [(A,), (B,)]), A:Rule(A, [(c,)]), B:Rule(B, [(c,)])}
+        conflictPath = os.path.join(cacheDir, 'conflict.lrt')
+        built = constructLR1Cached(conflictRules, S, [E, A, B, c], conflictPath, allowConflicts=True)
+        cached = constructLR1Cached(conflictRules, S, [E, A, B, c], conflictPath, allowConflicts=True)
+        assert cached.table.buffer is not None and len(built.conflicts) == 1
+        assert [(conflict.kind, conflict.state, conflict.token, conflict.rules) for conflict in cached.conflicts] == [(conflict.kind, conflict.state, conflict.token, conflict.rules) for conflict in built.conflicts]
+        assert isinstance(assertRaises(lambda: constructLR1Cached(conflictRules, S, [E, A, B, c], conflictPath)), ConflictError)
+
+        # 缓存文件损坏时重新构造
+        with open(cachePath, 'r+b') as f:
+            f.seek(12)
+            f.write(b'{"x": 1}')
+        rebuilt = constructLR1Cached(rules, S, tokens, cachePath, compress=True)
+        assert rebuilt.table.buffer is None
+
+        # tag不是字符串的符号无法写入缓存, 否则VN(1)与VN('1')的指纹相同
+        assertRaises(lambda: constructLR1Cached({VN(1): Rule(VN(1), [(ID,)])}, VN(1), [VN(1), ID], cachePath))
+
+
+# 生成独立的分析器模块, 导入后分析 id + id * ( id )
+def testGenerateParser():
+    rules, S, tokens = exprGrammar()
+    PLUS, MUL, LB, RB, ID = tokens[4:]
+    fsa = constructLR1(rules, S, tokens)
+
+    with tempfile.TemporaryDirectory() as outputDir:
+        for compress in (False, True):
+            path = generateParser(fsa, os.path.join(outputDir, 'exprParser.py'), compress)
+
+            spec = importlib.util.spec_from_file_location('exprParser', path)
+            parser = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(parser)
+
+            tree = parser.parse([ID, PLUS, ID, MUL, LB, ID, RB])
+            print(tree)
+            assert tree[0] == 'E' and tree[1][1] is PLUS
+
+
+# 推送式分析, 终结符来自生成器, 分批送入
+def testPushParser():
+    rules, S, tokens = exprGrammar()
+    PLUS, MUL, LB, RB, ID = tokens[4:]
+    fsa = constructLR1(rules, S, tokens, mode=LRMode.LALR1)
+
+    def tokenGenerator(count):
+        yield ID
+        for _ in range(count):
+            yield PLUS
+            yield ID
+
+    fsa.feed(LB)
+    fsa.feed_many(tokenGenerator(1000))
+    fsa.feed(RB)
+    fsa.feed_many(iter([MUL, ID]))
+    ast = fsa.finish()
+    assert ast.parent is VN('E') and ast.children[0].children[1] is MUL
+
+    # 同一个自动机连续分析多个输入
+    assert fsa.feed_many([ID, PLUS, ID, END]).parent is VN('E')
+    assert fsa.feed_many([ID, END]).parent is VN('E')
+    fsa.feed(LB)
+    fsa.reset()
+    fsa.feed(ID)
+    assert fsa.finish().parent is VN('E')
+
+    # 多个分析器互不影响
+    first, second = fsa.parser(), fsa.parser()
+    first.feed_many(tokenGenerator(10))
+    second.feed(ID)
+    assert second.finish().parent is VN('E')
+    assert first.feed(END).parent is VN('E') and first.position == 22
+
+
+def testSemanticAction():
+    rules, S, tokens = exprGrammar()
+    S, E, T, F, PLUS, MUL, LB, RB, ID = tokens
+    fsa = constructLR1(rules, S, tokens, mode=LRMode.LALR1)
+    fsa.setAction(SingleRule(E, (E, PLUS, T)), lambda a, plus, b: a + b)
+    fsa.setAction(SingleRule(T, (T, MUL, F)), lambda a, mul, b: a * b)
+    fsa.setAction(SingleRule(F, (LB, E, RB)), lambda lb, e, rb: e)
+
+    # 2 * (3 + 4) + 5, 终结符的值由feed给出
+    tokenStream = [ID, MUL, LB, ID, PLUS, ID, RB, PLUS, ID, END]
+    values = [2, None, None, 3, None, 4, None, None, 5]
+    assert fsa.analyse(tokenStream, values) == 19
+
+    for token, value in zip(tokenStream, values):
+        fsa.feed(token, value)
+    assert fsa.finish() == 19
+
+    # 取消全部语义动作后恢复构建AST
+    for rule in list(fsa.actions):
+        fsa.setAction(rule, None)
+    assert fsa.analyse([ID, END]).parent is E
+
+    # 推送式分析过程中注册的语义动作对之后的规约生效
+    fsa.feed(ID)
+    fsa.setAction(SingleRule(F, (ID,)), lambda x: 7)
+    assert fsa.finish() == 7
+
+
+def testCompactTree():
+    rules, S, tokens = exprGrammar()
+    S, E, T, F, PLUS, MUL, LB, RB, ID = tokens
+    fsa = constructLR1(rules, S, tokens, mode=LRMode.LALR1)
+    tokenStream = [ID, PLUS, LB, ID, MUL, ID, RB, END]
+
+    def fromTree(node):
+        if node.isLeaf:
+            return node.symbol
+        return (node.symbol, [fromTree(child) for child in node.children])
+
+    tree = fsa.analyse(tokenStream, compact=True)
+    assert fromTree(tree.node()) == toTuple(fsa.analyse(tokenStream))
+    assert tree.node().span == (0, 7) and len(tree) == 11
+
+    preorder = [node.symbol for node in tree.preorder()]
+    assert preorder[:5] == [E, E, T, F, ID] and len(preorder) == 18
+    # 节点按后序编号
+    postorder = [node.index for node in tree.postorder() if not node.isLeaf]
+    assert postorder == list(range(len(tree)))
+
+    loaded = pickle.loads(pickle.dumps(tree))
+    assert fromTree(loaded.node()) == fromTree(tree.node())
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'tree.bin')
+        tree.save(path)
+        mapped = CompactTree.load(path)
+        assert fromTree(mapped.node()) == fromTree(tree.node())
+        assert [node.span for node in mapped.preorder()] == [node.span for node in tree.preorder()]
+
+
+def testParseMany():
+    rules, S, tokens = exprGrammar()
+    S, E, T, F, PLUS, MUL, LB, RB, ID = tokens
+    fsa = constructLR1(rules, S, tokens, mode=LRMode.LALR1)
+
+    def streams(count):
+        for i in range(count):
+            yield [ID] + [PLUS, ID] * i + [END]
+
+    # 结果按输入顺序返回
+    trees = list(fsa.parse_many(streams(50), workers=2, compact=True, chunksize=4))
+    assert [tree.node().span for tree in trees] == [(0, 2 * i + 1) for i in range(50)]
+    assert [ast.parent for ast in fsa.parse_many(streams(5), workers=1)] == [E] * 5
+
+    assertRaises(lambda: list(fsa.parse_many([[ID, END], [ID, ID, END]], workers=2)))
+
+
+def testConstructLR1Parallel():
+    rules, S, tokens = exprGrammar()
+    serial = constructLR1(rules, S, tokens)
+
+    # 每一层都在进程池中扩展
+    minFrontier = LR1.PARALLEL_MIN_FRONTIER
+    LR1.PARALLEL_MIN_FRONTIER = 1
+    try:
+        parallel = constructLR1(rules, S, tokens, workers=2)
+    finally:
+        LR1.PARALLEL_MIN_FRONTIER = minFrontier
+
+    assert parallel.stats['parallelLevels'] == parallel.stats['levels']
+    # 状态编号与串行构造相同
+    for state, row in serial.stateToAction.items():
+        other = parallel.stateToAction[state]
+        assert row.keys() == other.keys()
+        assert all((row[token].kind, row[token].state, row[token].rule) == (other[token].kind, other[token].state, other[token].rule) for token in row)
+
+    # 没有足够大的层时不创建进程池
+    class NoMultiprocessing:
+        def __getattr__(self, name):
+            raise AssertionError('不应创建进程池')
+
+    multiprocessing, LR1.multiprocessing = LR1.multiprocessing, NoMultiprocessing()
+    try:
+        small = constructLR1(rules, S, tokens, workers=2)
+    finally:
+        LR1.multiprocessing = multiprocessing
+    assert small.stats['parallelLevels'] == 0 and small.stats['levels'] > 0
+
+
+def testConstructLR1Lazy():
+    rules, S, tokens = exprGrammar()
+    S, E, T, F, PLUS, MUL, LB, RB, ID = tokens
+    full = constructLR1(rules, S, tokens)
+
+    tokenStream = [ID, PLUS, LB, ID, MUL, ID, RB, END]
+    lazy = constructLR1Lazy(rules, S, tokens)
+    assert toTuple(lazy.analyse([ID, END])) == toTuple(full.analyse([ID, END]))
+    # 只计算了分析过程中到达的状态
+    assert lazy.stats['expanded'] < len(full.stateToAction)
+    assert toTuple(lazy.analyse(tokenStream)) == toTuple(full.analyse(tokenStream))
+
+    # 缓存有上限时, 淘汰的行重新计算, 结果不变
+    bounded = constructLR1Lazy(rules, S, tokens, cacheSize=2)
+    assert toTuple(bounded.analyse(tokenStream)) == toTuple(full.analyse(tokenStream))
+    assert len(bounded.rows) == 2 and bounded.stats['evicted'] > 0
+
+    # E : A | B, A : c, B : c 存在规约-规约冲突, 每次到达冲突的状态都抛出异常
+    A, B, c = VN('A'), VN('B'), VT('c', 'c')
+    rules = {S:Rule(S, [(E,)]), E:Rule(E, [(A,), (B,)]), A:Rule(A, [(c,)]), B:Rule(B, [(c,)])}
+    lazy = constructLR1Lazy(rules, S, [E, A, B, c])
+    for _ in range(2):
+        error = assertRaises(lambda: lazy.analyse([c, END]))
+        assert isinstance(error, ConflictError) and len(error.conflicts) == len(lazy.conflicts) == 1
+
+
+def testConstructLR1Incremental():
+    rules, S, tokens = exprGrammar()
+    S, E, T, F, PLUS, MUL, LB, RB, ID = tokens
+    previous = constructLR1Incremental(rules, S, tokens)
+
+    # F : ( E ) | id | num
+    NUM = VT('Num', 'num')
+    newRules = dict(rules)
+    newRules[F] = Rule(F, [(LB, E, RB), (ID,), (NUM,)])
+    newTokens = tokens + [NUM]
+    fsa = constructLR1Incremental(newRules, S, newTokens, previous=previous)
+    full = constructLR1(newRules, S, newTokens)
+
+    assert fsa.stats['states'] == len(full.stateToAction)
+    assert fsa.stats['changed'] == 1 and fsa.stats['reusedStates'] > 0
+
+    tokenStream = [NUM, PLUS, LB, ID, MUL, NUM, RB, END]
+    assert toTuple(fsa.analyse(tokenStream)) == toTuple(full.analyse(tokenStream))
+
+    # 改回原文法
+    restored = constructLR1Incremental(rules, S, tokens, previous=fsa)
+    assert restored.stats['states'] == previous.stats['states']
+    assert toTuple(restored.analyse([ID, MUL, ID, END])) == toTuple(previous.analyse([ID, MUL, ID, END]))
+
+    # 开始产生式改为 S : T, 项目重新编号, 不沿用上一次的状态
+    startRules = dict(rules)
+    startRules[S] = Rule(S, [(T,)])
+    fsa = constructLR1Incremental(startRules, S, tokens, previous=previous)
+    full = constructLR1(startRules, S, tokens)
+    assert fsa.stats['states'] == len(full.stateToAction) and fsa.stats['reusedStates'] == 0
+    assert toTuple(fsa.analyse([ID, MUL, ID, END])) == toTuple(full.analyse([ID, MUL, ID, END]))
+    assertRaises(lambda: fsa.analyse([ID, PLUS, ID, END]))
+
+
+def testRegExpToNFA():
+    nfa = RegExpToNFA('abcd[(kmn)*,(xyz)+]?abc')
+    for text in ('abcdabc', 'abcdkmnkmnabc', 'abcdxyzxyzabc'):
+        assert nfa.match(text)
+    for text in ('abcdxyzkmnabc', 'abcdabcabc', 'abcd'):
+        assert not nfa.match(text)
+
+    # 转义, 方括号外的逗号为普通字符, 空分支
+    assert RegExpToNFA('a\\*b').match('a*b') and not RegExpToNFA('a\\*b').match('ab')
+    assert RegExpToNFA('x,y').match('x,y')
+    assert RegExpToNFA('[a,]b').match('b') and RegExpToNFA('[a,]b').match('ab')
+
+    # 多个模式生成到同一个NFA中, 互不影响
+    nfa = RegExpToNFA('(ab)+')
+    RegExpToNFA('c*', nfa)
+    assert nfa.match('ccc') and not nfa.match('ab')
+
+    dfa = RegExpToDFA('(ab)*c')
+    for c in 'ababc':
+        dfa.consume(c)
+    assert dfa.accept()
+
+    # DFA状态只由有出边符号的状态与接收状态区分, 空边的环不产生多余的状态
+    dfa = RegExpToDFA('((a)*)*b')
+    assert len(dfa.stateMap) == 2 and dfa.stateMap[0] == {'a': 0, 'b': 1}
+
+    assertRaises(lambda: RegExpToNFA('(ab'))
+
+
+def testMinimizeDFA():
+    def accepts(dfa, text):
+        state = dfa.beginningState
+        for c in text:
+            if c not in dfa.stateMap[state]:
+                return False
+            state = dfa.stateMap[state][c]
+        return state in dfa.acceptedState
+
+    # 前缀树的相同后缀被合并: 初始状态, 读入首字母后, 读入x后(接收)
+    dfa = RegExpToDFA('[ax,bx,cx]')
+    minimized = dfa.minimize()
+    assert len(dfa.stateMap) > 3 and len(minimized.stateMap) == 3
+    assert sorted(minimized.stateMap) == [0, 1, 2] and minimized.acceptedState == {2}
+
+    pattern = 'a[(ba)*,(bab)+]?c'
+    dfa = RegExpToDFA(pattern)
+    minimized = dfa.minimize()
+    assert len(minimized.minimize().stateMap) == len(minimized.stateMap)
+    for text in ('ac', 'abac', 'ababac', 'ababc', 'ababbabc', 'abc', 'aba', 'c'):
+        assert accepts(dfa, text) == accepts(minimized, text)
+
+    # 不可达状态与无法到达接收状态的状态被删去
+    dfa = DFA({0: {'a': 1, 'b': 2}, 1: {}, 2: {'a': 3}, 3: {'a': 2}, 4: {'a': 0}}, {1}, 0)
+    minimized = dfa.minimize()
+    assert minimized.stateMap == {0: {'a': 1}, 1: {}} and minimized.acceptedState == {1}
+
+
+# 编译后的DFA与逐字符consume的结果相同
+def testDFATable():
+    dfa = RegExpToDFA('[[a,b]([a,b,0,1])*,([0,1])+]').minimize()
+    table = dfa.compile()
+    # a,b / 0,1 / 其余字符 各为一个等价类
+    assert table.classCount == 3 and table.classOf['a'] == table.classOf['b'] and table.classOf['0'] == table.classOf['1']
+
+    for text in ('ab01', '0110', '1a', 'abc', '', 'a中'):
+        dfa.state = dfa.beginningState
+        for c in text:
+            dfa.consume(c)
+        assert table.run(text) == dfa.state and table.accepts(text) == dfa.accept()
+    assert table.accepts(b'ba1') and table.accepts(memoryview(b'101')) and not table.accepts(bytearray(b'1a'))
+
+    # 最长匹配, 映射一次后可以从任意位置开始匹配
+    assert table.scan('ab1+01') == (3, table.run('ab1'))
+    classes = table.classify('ab1+01')
+    assert table.match(classes, 4)[0] == 6 and table.match(classes, 3) == (-1, DFA.error)
+
+    table = pickle.loads(pickle.dumps(table))
+    assert table.scan('ab1+01')[0] == 3
+
+
+# 词法分析的结果直接交给LR分析器, 原文作为终结符的值
+def testLexer():
+    rules, S, tokens = exprGrammar()
+    S, E, T, F, PLUS, MUL, LB, RB, ID = tokens
+    IF = VT('If', 'if')
+    letters = ','.join('abcdefghijklmnopqrstuvwxyz')
+    digits = ','.join('0123456789')
+    # 关键字在标识符之前, 长度相同时优先; 空白被跳过
+    lexer = constructLexer([('if', IF), ('[%s]([%s,%s])*' % (letters, letters, digits), ID), ('[%s]+' % digits, ID),
+                            ('\\+', PLUS), ('\\*', MUL), ('\\(', LB), ('\\)', RB), ('[ ,\\n]+', None)])
+
+    tokenStream, values = lexer.tokenize('if iffy x1+')
+    assert tokenStream == [IF, ID, ID, PLUS, END] and values[:4] == ['if', 'iffy', 'x1', '+']
+    assert [token for token, start, end in lexer.iterTokens(b'f(2)')] == [ID, LB, ID, RB]
+
+    fsa = constructLR1(rules, S, tokens, mode=LRMode.LALR1)
+    fsa.setAction(SingleRule(E, (E, PLUS, T)), lambda a, plus, b: a + b)
+    fsa.setAction(SingleRule(T, (T, MUL, F)), lambda a, mul, b: a * b)
+    fsa.setAction(SingleRule(F, (LB, E, RB)), lambda lb, e, rb: e)
+    fsa.setAction(SingleRule(F, (ID,)), int)
+    assert fsa.analyse(*lexer.tokenize('2 * (3 + 4)\n+ 15')) == 29
+
+    print(str(assertRaises(lambda: lexer.tokenize('2 - 1'))))
+    # 可以匹配空串的模式不能用于词法分析
+    assertRaises(lambda: constructLexer([('\\+', PLUS), ('(a)*', ID)]))
@@ -0,0 +1,97 @@
+from array import array
+import json
+import mmap
+import os
+import struct
+import sys
+
+# 列式二进制文件: MAGIC, 版本号, 元数据长度, JSON元数据(补齐到8字节), 各列的原始数据
+# 元数据中的layout为 {列名: [偏移, 元素个数, 类型]}, 每列按元素大小对齐
+# 分析表缓存与CompactTree均使用该格式, 加载时各列直接映射到内存, 不复制
+HEADER = struct.Struct('<4sII')
+
+
+def writeAtomic(path: str, chunks):
+    """writeAtomic 先写临时文件再替换, 其他进程不会读到不完整的文件
+
+    Args:
+        path (str): 文件路径
+        chunks: 依次写入的字节串
+    """
+    tmpPath = '%s.%d.tmp' % (path, os.getpid())
+    with open(tmpPath, 'wb') as f:
+        for chunk in chunks:
+            f.write(chunk)
+    os.replace(tmpPath, path)
+
+
+def typecodeOf(column) -> str:
+    return column.format if isinstance(column, memoryview) else column.typecode
+
+
+def saveColumns(path: str, magic: bytes, version: int, meta: dict, columns: dict):
+    """saveColumns 写入元数据与各列
+
+    Args:
+        meta (dict): 可以序列化为JSON的元数据, 写入时加入byteorder与layout
+        columns (dict): {列名: array或memoryview}, 为None的列不写入
+    """
+    layout = dict()
+    offset = 0
+    for name, column in columns.items():
+        if column is None:
+            continue
+        itemsize = column.itemsize
+        offset += -offset % itemsize
+        layout[name] = [offset, len(column), typecodeOf(column)]
+        offset += itemsize * len(column)
+
+    meta = dict(meta, byteorder=sys.byteorder, layout=layout)
+    metaBytes = json.dumps(meta, ensure_ascii=False).encode('utf-8')
+    metaBytes += b' ' * (-(HEADER.size + len(metaBytes)) % 8)
+
+    def chunks():
+        yield HEADER.pack(magic, version, len(metaBytes))
+        yield metaBytes
+        written = 0
+        for name, (start, length, typecode) in layout.items():
+            yield bytes(start - written)
+            data = memoryview(columns[name]).cast('B')
+            yield data
+            written = start + len(data)
+
+    writeAtomic(path, chunks())
+
+
+def loadColumns(path: str, magic: bytes, version: int, check=None):
+    """loadColumns 将文件映射到内存
+
+    Args:
+        check: check(meta)为False时不加载, 如缓存的指纹不一致
+
+    Returns:
+        (meta, columns, buffer): columns为 {列名: memoryview}, 不在layout中的列不出现
+            格式, 版本或字节序不符, 或者check不通过时返回None
+    """
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size < HEADER.size:
+            return None
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    fileMagic, fileVersion, metaLen = HEADER.unpack_from(buffer, 0)
+    if fileMagic != magic or fileVersion != version or HEADER.size + metaLen > len(buffer):
+        buffer.close()
+        return None
+
+    meta = json.loads(bytes(buffer[HEADER.size:HEADER.size + metaLen]).decode('utf-8'))
+    if meta['byteorder'] != sys.byteorder or (check is not None and not check(meta)):
+        buffer.close()
+        return None
+
+    start = HEADER.size + metaLen
+    view = memoryview(buffer)
+    columns = dict()
+    for name, (offset, length, typecode) in meta['layout'].items():
+        itemsize = array(typecode).itemsize
+        columns[name] = view[start + offset:start + offset + itemsize * length].cast(typecode)
+    return meta, columns, buffer